@@ -1,103 +1,316 @@
 import subprocess
 import json
+import logging
 import os
 import tempfile
 import re
 from pathlib import Path
-from homplexity_analysis import run_homplexity_analysis
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from homplexity_analysis import run_homplexity_analysis, run_homplexity_batch, HOMPLEXITY_BATCH_SIZE
+from project_ingestion import build_import_graph, dependencies
+from tool_cache import tool_cache, cache_key, file_digest
+from ghci_pool import ghci_pool, GhciError
+
+# Number of concurrent tool subprocesses used by analyze_project.
+ANALYSIS_WORKERS = int(os.getenv("ANALYSIS_WORKERS", os.cpu_count() or 1))
+
+# Parallel jobs (-j) used by the whole-tree `ghc --make` pass.
+GHC_JOBS = int(os.getenv("GHC_JOBS", ANALYSIS_WORKERS))
+# "make" type-checks with a cold `ghc --make -fno-code` process per pass, "ghci" with the warm sessions of ghci_pool.
+GHC_CHECK_MODE = os.getenv("GHC_CHECK_MODE", "make")
+GHCI_FAILED = re.compile(r"^Failed,", re.MULTILINE)
+GHC_ERROR = re.compile(r"^(?P<file>\S.*?\.l?hs):(?:\d+:\d+(?:-\d+)?|\(\d+,\d+\)-\(\d+,\d+\)): error", re.MULTILINE)
+
+# Number of files passed to a single `hlint --json` invocation.
+HLINT_BATCH_SIZE = int(os.getenv("HLINT_BATCH_SIZE", 200))
+
+def cached_hlint_ideas(key, file_path):
+    ideas = tool_cache.get(key)
+    if ideas is not None:
+        # The same content may have been linted under another path (e.g. a variant tree)
+        for idea in ideas:
+            idea["file"] = file_path
+    return ideas
+
+def run_hlint_json(file_paths):
+    """
+    Runs `hlint --json` over file_paths and returns its ideas, or None if hlint
+    could not be run, crashed (exit status other than 0 or 1) or printed invalid JSON.
+    """
+    try:
+        result = subprocess.run(["hlint", "--json"] + list(file_paths), capture_output=True, text=True)
+    except OSError as e:
+        logging.warning("Could not run hlint: %s", e)
+        return None
+    if result.returncode not in (0, 1):
+        logging.warning("hlint exited with status %s: %s", result.returncode, result.stderr.strip())
+        return None
+    try:
+        ideas = json.loads(result.stdout)
+    except ValueError:
+        logging.warning("hlint printed invalid JSON: %s", result.stdout[:200])
+        return None
+    return ideas if isinstance(ideas, list) else None
 
 def run_hlint(file_path):
-    cmd = ["hlint", "--json", file_path]
-    result = subprocess.run(cmd, capture_output=True, text=True)
-    return json.loads(result.stdout)
-
-def analyze_project(project_dir, source_files):
-    analysis = {"pre_refactor": {"overall": {}, "files": []}, "post_refactor": {}}
-    total_loc = 0
-    total_homplexity_loc = 0
-    cc_min_vals = []
-    cc_max_vals = []
-    cc_average_vals = []
-    cc_sum_vals = []
-    hlint_summary = {"error": 0, "warning": 0, "suggestion": 0, "ignore": 0, "total": 0}
-    total_syntax_errors = 0
+    key = cache_key("hlint", ["--json"], [file_digest(file_path)])
+    ideas = cached_hlint_ideas(key, file_path)
+    if ideas is not None:
+        return ideas
+    ideas = run_hlint_json([file_path])
+    if ideas is None:
+        # Failed runs are reported as no ideas but never cached
+        return []
+    tool_cache.put(key, ideas)
+    return ideas
 
-    for file in source_files:
-        with open(file, "r") as f:
-            code = f.read()
-        loc = len(code.splitlines())
-        total_loc += loc
+def run_hlint_batch(file_paths):
+    """
+    Runs `hlint --json` once over the files of file_paths not found in the tool
+    cache and splits the ideas back out by their `file` field.
+    Returns a dict mapping each input path to its ideas.
+    """
+    ideas_by_file = {}
+    keys = {}
+    for file in file_paths:
+        key = cache_key("hlint", ["--json"], [file_digest(file)])
+        ideas = cached_hlint_ideas(key, file)
+        if ideas is None:
+            keys[file] = key
+        else:
+            ideas_by_file[file] = ideas
+    if not keys:
+        return ideas_by_file
 
-        # u_project_dir = Path(project_dir)
-        # u_file = Path(file)
-        u_project_dir = Path(project_dir)
-        u_file = Path(file)
+    misses = {file: [] for file in keys}
+    normalized = {os.path.normpath(file): file for file in keys}
+    ideas = run_hlint_json(keys)
+    for idea in ideas or []:
+        file = normalized.get(os.path.normpath(idea.get("file", "")))
+        if file is not None:
+            misses[file].append(idea)
+    if ideas is not None:
+        # Failed runs are reported as no ideas but never cached
+        for file, file_ideas in misses.items():
+            tool_cache.put(keys[file], file_ideas)
+    ideas_by_file.update(misses)
+    return ideas_by_file
 
+def ghc_file_check(file_path):
+    """
+    Type-checks one file on its own; returns (error_count, completed). completed is
+    False when GHC could not be run, or failed without reporting any error.
+    """
+    if GHC_CHECK_MODE == "ghci":
+        try:
+            output = ghci_pool.check([file_path])
+            errors = sum(1 for line in output.split("\n") if "error:" in line)
+            return errors, errors > 0 or GHCI_FAILED.search(output) is None
+        except (GhciError, OSError):
+            pass  # fall back to a cold ghc process
+    try:
+        syntax_errors = subprocess.run(["ghc", "-fno-code", file_path], capture_output=True, text=True)
+    except OSError as e:
+        logging.warning("Could not run ghc: %s", e)
+        return 0, False
+    error_lines = syntax_errors.stderr.split("\n")  # Split output into lines
+    errors = sum(1 for line in error_lines if "error:" in line)  # Count error occurrences
+    return errors, errors > 0 or syntax_errors.returncode == 0
 
-        static_refactored_file = str(u_project_dir.parent / "static_refactored" / u_file.relative_to(u_project_dir))
-        llm_only_refactored_file = str(u_project_dir.parent / "llm_only_refactored" / u_file.relative_to(u_project_dir))
-        hybrid_refactored_file = str(u_project_dir.parent / "hybrid_refactored" / u_file.relative_to(u_project_dir))
+def run_ghc_check(file_path):
+    return ghc_file_check(file_path)[0]
 
-        hlint_issues = run_hlint(file)
-        # print(hlint_issues)
-        file_hlint = {"error": 0, "warning": 0, "suggestion": 0, "ignore": 0, "total": len(hlint_issues)}
-        for issue in hlint_issues:
-            hint = issue.get("severity", "").lower()
-            if "error" in hint:
-                file_hlint["error"] += 1
-            elif "warning" in hint:
-                file_hlint["warning"] += 1
-            elif "suggestion" in hint:
-                file_hlint["suggestion"] += 1
-            elif "ignore" in hint:
-                file_hlint["ignore"] += 1
-
-        syntax_errors = subprocess.run(["ghc", "-fno-code", file], capture_output=True, text=True)
-        # err_count = 1 if syntax_errors.returncode != 0 else 0
-        # total_syntax_errors += err_count
-        error_lines = syntax_errors.stderr.split("\n")  # Split output into lines
-        err_count = sum(1 for line in error_lines if "error:" in line)  # Count error occurrences
-        total_syntax_errors += err_count
-
-        homplexity_data = run_homplexity_analysis(file)
-        cc_min = homplexity_data.get("cyclomatic_complexity", {}).get("min", 0)
-        cc_max = homplexity_data.get("cyclomatic_complexity", {}).get("max", 0)
-        cc_average = homplexity_data.get("cyclomatic_complexity", {}).get("average", 0)
-        cc_sum = homplexity_data.get("cyclomatic_complexity", {}).get("sum", 0)
-        cc_min_vals.append(cc_min)
-        cc_max_vals.append(cc_max)
-        cc_average_vals.append(cc_average)
-        cc_sum_vals.append(cc_sum)
-
-        homplexity_loc = homplexity_data.get("homplexity_loc", 0)
-        total_homplexity_loc += homplexity_loc
+def ghc_make_check(files, source_roots):
+    """
+    Type-checks files together (GHC_CHECK_MODE) and returns (diagnostics output, whether
+    the check failed); a GHC that cannot be run counts as a failed check without output.
+    """
+    if GHC_CHECK_MODE == "ghci":
+        try:
+            output = ghci_pool.check(files, source_roots)
+            return output, GHCI_FAILED.search(output) is not None
+        except (GhciError, OSError):
+            pass  # fall back to a cold ghc process
+    include_flags = [f"-i{root}" for root in source_roots]
+    with tempfile.TemporaryDirectory() as output_dir:
+        # -keep-going: a module with errors must not stop GHC from checking the unrelated ones
+        cmd = ["ghc", "--make", "-fno-code", "-keep-going", f"-j{GHC_JOBS}", "-outputdir", output_dir] + include_flags + files
+        try:
+            result = subprocess.run(cmd, capture_output=True, text=True)
+        except OSError as e:
+            logging.warning("Could not run ghc: %s", e)
+            return "", True
+    return result.stderr, result.returncode != 0
 
-        # quality_score = calculate_code_quality(loc, cc)
-        quality_score = calculate_code_quality(homplexity_loc, cc_sum)
-
-        file_metrics = {
-            "file_name": file,
-            "cyclomatic_complexity": homplexity_data.get("cyclomatic_complexity", {"min":0,"max":0,"average":0,"sum":0}),
-            "hlint_suggestions": file_hlint,
-            "syntax_errors": err_count,
-            "lines_of_code": loc,
-            "homplexity_lines_of_code": homplexity_loc,
-            "code_quality_score": quality_score,
-            "test_coverage": 80,  # Placeholder
-            "performance": {"memory_usage": "10MB", "runtime": "0.5s"},  # Placeholder
-            "security_vulnerabilities": 0,  # Placeholder
-            "homplexity_analysis": homplexity_data,
-            "original_code": code,
-            "suggestions": hlint_issues,
-            "refactored_code": {"static_refactored_file": static_refactored_file, "llm_only_refactored_file": llm_only_refactored_file, "hybrid_refactored_file": hybrid_refactored_file}
+def run_ghc_batch(file_paths, known_errors=None, import_graph=None):
+    """
+    Type-checks file_paths with `ghc --make -fno-code -j` (or a warm ghci session,
+    see GHC_CHECK_MODE), one pass per set of distinct module names, and attributes the error diagnostics back to files.
+    A file's result is cached under its content plus the content of every local
+    module it transitively imports, so only files whose dependency cone changed are re-checked.
+    known_errors maps files already known to be unaffected to their error count; they
+    stay importable but are not re-checked.
+    Returns a dict mapping each input path to its error count.
+    """
+    known_errors = known_errors or {}
+    import_graph = import_graph or build_import_graph(file_paths)
+    module_names = import_graph["modules"]
+    source_roots = set()
+    for file in file_paths:
+        # Strip the module path (A/B/C.hs for module A.B.C) to find the -i search root
+        root = Path(file).parent
+        for _ in module_names[file].split(".")[:-1]:
+            root = root.parent
+        source_roots.add(str(root))
+
+    digests = {}
+    def digest(file):
+        if file not in digests:
+            digests[file] = file_digest(file)
+        return digests[file]
+
+    err_counts = {}
+    keys = {}
+    batches = []
+    for file in file_paths:
+        if file in known_errors:
+            err_counts[file] = known_errors[file]
+            continue
+        key = cache_key("ghc", ["--make", "-fno-code"], [digest(file)] + sorted(digest(dep) for dep in dependencies(import_graph, file)))
+        cached = tool_cache.get(key)
+        if cached is not None:
+            err_counts[file] = cached
+            continue
+        keys[file] = key
+        # Several executables can each define Main; they cannot share a --make pass
+        for batch in batches:
+            if module_names[file] not in batch:
+                batch[module_names[file]] = file
+                break
+        else:
+            batches.append({module_names[file]: file})
+
+    for batch in batches:
+        files = list(batch.values())
+        for file in files:
+            err_counts[file] = 0
+        by_path = {os.path.abspath(file): file for file in files}
+        output, failed = ghc_make_check(files, sorted(source_roots))
+        diagnostics = 0
+        for match in GHC_ERROR.finditer(output):
+            diagnostics += 1
+            file = by_path.get(os.path.abspath(match.group("file")))
+            if file is not None:
+                err_counts[file] += 1
+        completed = {file: not failed or diagnostics > 0 for file in files}
+        if failed and diagnostics == 0:
+            # The pass failed before reaching any module (e.g. an import cycle); check files one by one
+            for file in files:
+                err_counts[file], completed[file] = ghc_file_check(file)
+        for file in files:
+            # A check that did not complete says nothing about the file; never cache it
+            if completed[file]:
+                tool_cache.put(keys[file], err_counts[file])
+    return err_counts
+
+def summarize_hlint(hlint_issues):
+    file_hlint = {"error": 0, "warning": 0, "suggestion": 0, "ignore": 0, "total": len(hlint_issues)}
+    for issue in hlint_issues:
+        hint = issue.get("severity", "").lower()
+        if "error" in hint:
+            file_hlint["error"] += 1
+        elif "warning" in hint:
+            file_hlint["warning"] += 1
+        elif "suggestion" in hint:
+            file_hlint["suggestion"] += 1
+        elif "ignore" in hint:
+            file_hlint["ignore"] += 1
+    return file_hlint
+
+def run_tools(source_files, workers=None, import_graph=None, tree_files=None, known_errors=None, progress=None, on_result=None):
+    """
+    Runs HLint, GHC and homplexity on every file on a pool of subprocess workers.
+    HLint is invoked once per chunk of HLINT_BATCH_SIZE files, GHC once over the
+    whole module set (tree_files, defaulting to source_files) and homplexity once
+    per chunk of files, chunks being small enough to keep every worker busy.
+    import_graph and known_errors are passed through to run_ghc_batch.
+    progress, if given, is called as progress(files_done, files_total) while files finish.
+    on_result, if given, is called as on_result(index, result) as soon as the three
+    results of source_files[index] are in (all at once when GHC is the last to finish).
+    Returns a list of (hlint_issues, err_count, homplexity_data) tuples in source_files order.
+    """
+    workers = workers or ANALYSIS_WORKERS
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        hlint_chunks = [
+            pool.submit(run_hlint_batch, source_files[i:i + HLINT_BATCH_SIZE])
+            for i in range(0, len(source_files), HLINT_BATCH_SIZE)
+        ]
+        ghc_errors = pool.submit(run_ghc_batch, tree_files or source_files, known_errors, import_graph)
+        homplexity_chunk_size = max(1, min(HOMPLEXITY_BATCH_SIZE, -(-len(source_files) // workers)))
+        homplexity_chunks = {
+            pool.submit(run_homplexity_batch, source_files[i:i + homplexity_chunk_size]): len(source_files[i:i + homplexity_chunk_size])
+            for i in range(0, len(source_files), homplexity_chunk_size)
         }
-        hlint_summary["suggestion"] += file_hlint["suggestion"]
-        hlint_summary["error"] += file_hlint["error"]
-        hlint_summary["warning"] += file_hlint["warning"]
-        hlint_summary["ignore"] += file_hlint["ignore"]
-        hlint_summary["total"] += file_hlint["total"]
+        tools = {chunk: "hlint" for chunk in hlint_chunks}
+        tools[ghc_errors] = "ghc"
+        tools.update({chunk: "homplexity" for chunk in homplexity_chunks})
+        hlint_issues = {}
+        homplexity_data = {}
+        err_counts = None
+        waiting = list(range(len(source_files)))
+        files_done = 0
+        for future in as_completed(tools):
+            if tools[future] == "hlint":
+                hlint_issues.update(future.result())
+            elif tools[future] == "ghc":
+                err_counts = future.result()
+            else:
+                homplexity_data.update(future.result())
+                if progress:
+                    files_done += homplexity_chunks[future]
+                    progress(files_done, len(source_files))
+            if on_result and err_counts is not None:
+                # Report every file whose three tool results are now all in
+                still_waiting = []
+                for index in waiting:
+                    file = source_files[index]
+                    if file in hlint_issues and file in homplexity_data:
+                        on_result(index, (hlint_issues[file], err_counts[file], homplexity_data[file]))
+                    else:
+                        still_waiting.append(index)
+                waiting = still_waiting
+        return [
+            (hlint_issues[file], err_counts[file], homplexity_data[file])
+            for file in source_files
+        ]
 
-        analysis["pre_refactor"]["files"].append(file_metrics)
+def build_file_metrics(file_name, code, hlint_issues, err_count, homplexity_data):
+    homplexity_loc = homplexity_data.get("homplexity_loc", 0)
+    cc_sum = homplexity_data.get("cyclomatic_complexity", {}).get("sum", 0)
+    return {
+        "file_name": file_name,
+        "cyclomatic_complexity": homplexity_data.get("cyclomatic_complexity", {"min":0,"max":0,"average":0,"sum":0}),
+        "hlint_suggestions": summarize_hlint(hlint_issues),
+        "syntax_errors": err_count,
+        "lines_of_code": len(code.splitlines()),
+        "homplexity_lines_of_code": homplexity_loc,
+        # quality_score = calculate_code_quality(loc, cc)
+        "code_quality_score": calculate_code_quality(homplexity_loc, cc_sum),
+        "test_coverage": 80,  # Placeholder
+        "performance": {"memory_usage": "10MB", "runtime": "0.5s"},  # Placeholder
+        "security_vulnerabilities": 0,  # Placeholder
+        "homplexity_analysis": homplexity_data,
+    }
+
+def build_overall(files):
+    cc_min_vals = [f["cyclomatic_complexity"].get("min", 0) for f in files]
+    cc_max_vals = [f["cyclomatic_complexity"].get("max", 0) for f in files]
+    cc_sum_vals = [f["cyclomatic_complexity"].get("sum", 0) for f in files]
+    hlint_summary = {"error": 0, "warning": 0, "suggestion": 0, "ignore": 0, "total": 0}
+    for f in files:
+        for key in hlint_summary:
+            hlint_summary[key] += f["hlint_suggestions"][key]
+    total_homplexity_loc = sum(f["homplexity_lines_of_code"] for f in files)
 
     overall_cc = {"min": sum(cc_min_vals) if cc_min_vals else 0,
                   "max": sum(cc_max_vals) if cc_max_vals else 0,
@@ -106,17 +319,51 @@ def analyze_project(project_dir, source_files):
     # overall_quality = calculate_code_quality(total_loc, overall_cc.get("sum", 0))
     overall_quality = calculate_code_quality(total_homplexity_loc, overall_cc.get("sum", 0))
 
-    analysis["pre_refactor"]["overall"] = {
+    return {
         "cyclomatic_complexity": overall_cc,
         "hlint_suggestions": hlint_summary,
-        "syntax_errors": total_syntax_errors,
-        "lines_of_code": total_loc,
+        "syntax_errors": sum(f["syntax_errors"] for f in files),
+        "lines_of_code": sum(f["lines_of_code"] for f in files),
         "homplexity_lines_of_code": total_homplexity_loc,
         "code_quality_score": overall_quality,
         "test_coverage": 80,  # Placeholder
         "performance": {"memory_usage": "150MB", "runtime": "2.3s"},  # Placeholder
         "security_vulnerabilities": 2  # Placeholder
     }
+
+def analyze_project(project_dir, source_files, workers=None, import_graph=None, progress=None, on_file=None):
+    import_graph = import_graph or build_import_graph(source_files)
+    analysis = {"pre_refactor": {"overall": {}, "files": []}, "post_refactor": {}, "import_graph": import_graph}
+    files = [None] * len(source_files)
+
+    def build(index, tool_result):
+        hlint_issues, err_count, homplexity_data = tool_result
+        file = source_files[index]
+        with open(file, "r") as f:
+            code = f.read()
+
+        u_project_dir = Path(project_dir)
+        u_file = Path(file)
+
+        static_refactored_file = str(u_project_dir.parent / "static_refactored" / u_file.relative_to(u_project_dir))
+        llm_only_refactored_file = str(u_project_dir.parent / "llm_only_refactored" / u_file.relative_to(u_project_dir))
+        hybrid_refactored_file = str(u_project_dir.parent / "hybrid_refactored" / u_file.relative_to(u_project_dir))
+
+        file_metrics = build_file_metrics(file, code, hlint_issues, err_count, homplexity_data)
+        file_metrics.update({
+            "original_code": code,
+            "suggestions": hlint_issues,
+            "refactored_code": {"static_refactored_file": static_refactored_file, "llm_only_refactored_file": llm_only_refactored_file, "hybrid_refactored_file": hybrid_refactored_file}
+        })
+        files[index] = file_metrics
+        if on_file:
+            on_file(file_metrics)
+
+    # Files are built (and published) as their tool results come in, but reported in source_files order
+    run_tools(source_files, workers, import_graph=import_graph, progress=progress, on_result=build)
+    analysis["pre_refactor"]["files"] = files
+
+    analysis["pre_refactor"]["overall"] = build_overall(analysis["pre_refactor"]["files"])
     return analysis
 
 def analyze_code_string(code_str, file_name="temp.hs"):
@@ -136,8 +383,11 @@ def analyze_code_string(code_str, file_name="temp.hs"):
         elif "redundant" in hint or "duplicate" in hint:
             file_hlint["redundancy"] += 1
 
-    syntax_errors = subprocess.run(["ghc", "-fno-code", tmp_path], capture_output=True, text=True)
-    err_count = 1 if syntax_errors.returncode != 0 else 0
+    if GHC_CHECK_MODE == "ghci":
+        err_count = 1 if run_ghc_check(tmp_path) else 0
+    else:
+        syntax_errors = subprocess.run(["ghc", "-fno-code", tmp_path], capture_output=True, text=True)
+        err_count = 1 if syntax_errors.returncode != 0 else 0
 
     homplexity_data = run_homplexity_analysis(tmp_path)
     cc = homplexity_data.get("cyclomatic_complexity", {}).get("sum", 0)
@@ -1,20 +1,77 @@
-from fastapi import FastAPI, File, UploadFile, Form, HTTPException
-from fastapi.responses import JSONResponse
-from fastapi.responses import FileResponse
-import logging, traceback
+from fastapi import FastAPI, File, UploadFile, Form, HTTPException, Request
+from fastapi.responses import JSONResponse, Response, PlainTextResponse
+from fastapi.responses import StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
+from starlette.concurrency import run_in_threadpool
 from typing import List, Optional
 from pydantic import BaseModel
+import gzip
+import hashlib
 import json
-from io import BytesIO
 import os
+import shutil
+import tempfile
+import zipfile
+from functools import partial
 
-from project_ingestion import ingest_project
+from project_ingestion import ingest_project, build_import_graph
 from analysis import analyze_project
 from refactor import refactor_files
-from report import generate_report
+from experiments import run_experiments, parse_cells, EXPERIMENT_CELLS
+from report import (generate_report, build_report, compact_report, expand_blobs, write_compressed_report,
+                    read_compressed_report, report_file_id, file_summary)
+from blob_store import blob_store
+from run_store import run_store, TOP_METRICS
+from tool_cache import tool_cache
+from llm_client import llm_cache
+from jobs import job_queue
+
+# Request bodies over MAX_UPLOAD_BYTES are rejected; uploads are copied to disk in chunks of UPLOAD_CHUNK_SIZE.
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", 1024 * 1024))
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", 1024 * 1024 * 1024))
+UPLOAD_DIR = os.getenv("UPLOAD_DIR", "/tmp/uploads")
+# Reports are gzip-compressed JSON with code and tool output kept in the blob store;
+# the dashboard reads the latest one.
+LATEST_REPORT_PATH = "project_result/project_result.json.gz"
+# Default and maximum page sizes of /files
+FILES_PAGE_SIZE = 50
+FILES_MAX_PAGE_SIZE = 500
+# Upper bound on n for /runs/{run_id}/top
+TOP_FILES_MAX = 1000
+
+class BodySizeLimitMiddleware:
+    """
+    Rejects request bodies over MAX_UPLOAD_BYTES with 413 before they are parsed:
+    up front when Content-Length says so, otherwise as soon as the streamed body
+    passes the limit, so an oversized upload is never spooled in full.
+    """
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        too_large = f"Upload exceeds {MAX_UPLOAD_BYTES} bytes"
+        content_length = dict(scope["headers"]).get(b"content-length", b"")
+        if content_length.isdigit() and int(content_length) > MAX_UPLOAD_BYTES:
+            return await JSONResponse({"detail": too_large}, status_code=413)(scope, receive, send)
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > MAX_UPLOAD_BYTES:
+                    raise HTTPException(status_code=413, detail=too_large)
+            return message
+
+        await self.app(scope, limited_receive, send)
 
 app = FastAPI(title="Haskell Refactoring and Analysis API", version="1.0.0")
+# Added first so that it runs inside CORS and gzip, and its 413s get their headers
+app.add_middleware(BodySizeLimitMiddleware)
 
 # CORS settings to allow React frontend
 origins = [
@@ -28,6 +85,7 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(GZipMiddleware, minimum_size=1000)
 
 class IngestResponse(BaseModel):
     source_files: List[str]
@@ -45,95 +103,270 @@ class ReportRequest(BaseModel):
     analysis_results: dict
     project_name: Optional[str] = "ExampleProject"
 
+def spool_upload(upload_file):
+    """
+    Copies an upload's spooled file to a file under UPLOAD_DIR that outlives the request
+    and returns its path. Blocking; run it in the threadpool.
+    """
+    os.makedirs(UPLOAD_DIR, exist_ok=True)
+    fd, zip_path = tempfile.mkstemp(suffix=".zip", dir=UPLOAD_DIR)
+    try:
+        upload_file.seek(0)
+        with os.fdopen(fd, "wb") as f:
+            shutil.copyfileobj(upload_file, f, UPLOAD_CHUNK_SIZE)
+        if not zipfile.is_zipfile(zip_path):
+            raise HTTPException(status_code=400, detail="Upload is not a zip archive")
+    except BaseException:
+        os.remove(zip_path)
+        raise
+    return zip_path
+
+def publish_file(job_id, file_order, variant, strategy, file_metrics):
+    """
+    Records an evaluated file in the job's run at its position in the source list
+    (file_order maps file names to it), then streams its summary to the job's listeners.
+    """
+    run_store.record_file(job_id, variant, strategy, file_metrics, file_order.get(file_metrics["file_name"]))
+    job_queue.publish_file(job_id, variant, strategy, file_summary(file_metrics))
+
+def run_ingest_pipeline(job_id, zip_path, repo_url, branch, cells):
+    run_store.create_run(job_id, "ProjectName")
+    try:
+        report_path = run_pipeline_stages(job_id, zip_path, repo_url, branch, cells)
+    except BaseException:
+        run_store.finish_run(job_id, "failed")
+        raise
+    run_store.finish_run(job_id, "completed", report_path)
+    return report_path
+
+def run_pipeline_stages(job_id, zip_path, repo_url, branch, cells):
+    job_queue.set_stage(job_id, "ingesting")
+    try:
+        source_files, project_dir = ingest_project(
+            uploaded_zip=zip_path,
+            repo_url=repo_url,
+            branch=branch
+        )
+    finally:
+        if zip_path:
+            os.remove(zip_path)
+    if not source_files:
+        raise ValueError("No Haskell source files found")
+
+    import_graph = build_import_graph(source_files)
+    # Run rows are listed in report order, whatever order the files finish in
+    file_order = {file_name: index for index, file_name in enumerate(source_files)}
+    job_queue.set_stage(job_id, "analyzing", len(source_files))
+    analysis_results = analyze_project(project_dir, source_files, import_graph=import_graph,
+                                       progress=partial(job_queue.set_progress, job_id),
+                                       on_file=partial(publish_file, job_id, file_order, "pre_refactor", None))
+
+    job_queue.set_stage(job_id, "refactoring", len(source_files))
+    analysis_results["post_refactor"] = run_experiments(analysis_results, project_dir, cells,
+                                                        progress=partial(job_queue.set_progress, job_id),
+                                                        on_file=partial(publish_file, job_id, file_order))
+
+    job_queue.set_stage(job_id, "reporting")
+    final_report = compact_report(build_report(analysis_results, project_name="ProjectName"), blob_store)
+    os.makedirs("project_result", exist_ok=True)
+    report_path = f"project_result/{job_id}.json.gz"
+    write_compressed_report(final_report, report_path)
+    shutil.copyfile(report_path, LATEST_REPORT_PATH + ".tmp")
+    os.replace(LATEST_REPORT_PATH + ".tmp", LATEST_REPORT_PATH)
+    return report_path
+
 # @app.post("/ingest", response_model=IngestResponse)
 @app.post("/ingest")
 async def ingest(
     uploaded_zip: Optional[UploadFile] = File(None),
     repo_url: Optional[str] = Form(None),
-    branch: str = Form("main")
+    branch: str = Form("main"),
+    cells: Optional[str] = Form(None)
 ):
-    # try:
-    #     source_files, project_dir = ingest_project(
-    #         uploaded_zip=uploaded_zip,
-    #         repo_url=repo_url,
-    #         branch=branch
-    #     )
-    # except Exception as e:
-    #     raise HTTPException(status_code=400, detail=str(e))
-
-    zip_buffer = None
-    if uploaded_zip:
-        contents = await uploaded_zip.read()
-        zip_buffer = BytesIO(contents)
-    
+    """
+    Starts the pipeline on an uploaded zip or a git repository. cells selects the
+    experiment cells to run ("all", or e.g. "static:one_shot,hybrid:zero_shot");
+    the default is EXPERIMENT_CELLS.
+    """
     try:
-        source_files, project_dir = ingest_project(
-            uploaded_zip=zip_buffer,
-            repo_url=repo_url,
-            branch=branch
-         )
-        if source_files:
-            analysis_results = analyze_project(project_dir, source_files)
-            # return analysis_results
-            pre_refactor_overall = analysis_results["pre_refactor"]["overall"]
-            refactored_results = refactor_files(analysis_results, project_dir)
-
-            analysis_results["post_refactor"] = refactored_results
-            final_report = generate_report(analysis_results, project_name="ProjectName")
-            # Save to a JSON file
-            with open("project_result/project_result.json", "w", encoding="utf-8") as f:
-                # json.dump(final_report, f, indent=2)
-                f.write(final_report)
-            # print(type(final_report))
-            return final_report
-            
-            
-    except Exception as e:
-        logging.error("Ingestion failed:\n%s", traceback.format_exc())
+        cells = parse_cells(cells or EXPERIMENT_CELLS)
+    except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
-    return {"source_files": source_files, "project_dir": project_dir}
-    
+    zip_path = None
+    if uploaded_zip:
+        zip_path = await run_in_threadpool(spool_upload, uploaded_zip.file)
+    elif not repo_url:
+        raise HTTPException(status_code=400, detail="Provide uploaded_zip or repo_url")
 
+    job_id = job_queue.submit(run_ingest_pipeline, zip_path, repo_url, branch, cells)
+    return {"job_id": job_id, "status_url": f"/jobs/{job_id}"}
 
+@app.get("/jobs/{job_id}")
+def get_job(job_id: str):
+    job = job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
 
+@app.get("/jobs/{job_id}/stream")
+def stream_job(job_id: str, format: str = "ndjson"):
+    """
+    Streams the job's stage changes and a summary of each file's metrics (pre_refactor,
+    then every experiment cell) as soon as that file is evaluated, as newline-delimited
+    JSON or, with format=sse, as server-sent events. Each file event carries a
+    detail_url to its full entry under /files/{file_id}.
+    """
+    if job_queue.get(job_id) is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    def events():
+        for event in job_queue.stream(job_id):
+            if format == "sse":
+                yield ": keep-alive\n\n" if event is None else f"data: {json.dumps(event)}\n\n"
+            elif event is not None:
+                yield json.dumps(event) + "\n"
+
+    media_type = "text/event-stream" if format == "sse" else "application/x-ndjson"
+    return StreamingResponse(events(), media_type=media_type)
+
+def serve_report(file_path, request, expand):
+    """
+    Serves a compressed report as stored (blob references in place of code), sending
+    the gzip bytes straight through when the client accepts them; with expand,
+    every blob is inlined first.
+    """
+    if not os.path.exists(file_path):
+        return {"error": "File not found"}
+    if expand:
+        return JSONResponse(content=expand_blobs(read_compressed_report(file_path), blob_store))
+    with open(file_path, "rb") as f:
+        body = f.read()
+    if "gzip" in request.headers.get("accept-encoding", ""):
+        return Response(content=body, media_type="application/json", headers={"Content-Encoding": "gzip"})
+    return Response(content=gzip.decompress(body), media_type="application/json")
 
 @app.get("/result_json")
-def get_project_result():
-    file_path = "project_result/project_result.json"
-    if os.path.exists(file_path):
-        return FileResponse(file_path, media_type="application/json")
-    return {"error": "File not found"}
+def get_project_result(request: Request, expand: bool = False):
+    return serve_report(LATEST_REPORT_PATH, request, expand)
 
 @app.get("/file_detail")
-def get_project_result():
-    file_path = "project_result/project_result.json"
-    if os.path.exists(file_path):
-        return FileResponse(file_path, media_type="application/json")
-    return {"error": "File not found"}
+def get_project_result(request: Request, expand: bool = False):
+    return serve_report(LATEST_REPORT_PATH, request, expand)
+
+def resolve_run(run_id):
+    """Returns (run_id, version) for the given run, or the latest completed run when run_id is None."""
+    run_id = run_id or run_store.latest_run_id()
+    run = run_store.get_run(run_id) if run_id else None
+    if run is None:
+        raise HTTPException(status_code=404, detail="Run not found" if run_id else "No completed run available")
+    return run_id, f"{run_id}-{run['updated']!r}"
+
+def conditional_json(request, version, content):
+    """JSONResponse with an ETag for this run version and query; 304 if the client already has it."""
+    query = hashlib.sha256(str(request.url.query).encode()).hexdigest()[:12]
+    etag = f'"{version}-{query}"'
+    if etag in request.headers.get("if-none-match", ""):
+        return Response(status_code=304, headers={"ETag": etag})
+    return JSONResponse(content=content, headers={"ETag": etag})
+
+def project_file(file_metrics, fields):
+    """The file's entry with its file_id, reduced to the comma-separated fields if given."""
+    projected = {"file_id": report_file_id(file_metrics["file_name"])}
+    if fields:
+        wanted = set(fields.split(","))
+        projected.update({key: value for key, value in file_metrics.items() if key in wanted})
+    else:
+        projected.update(file_metrics)
+    return projected
+
+@app.get("/runs")
+def list_runs(limit: int = 50):
+    return run_store.list_runs(max(1, limit))
+
+@app.get("/runs/{run_id}")
+def get_run(run_id: str):
+    run = run_store.get_run(run_id)
+    if run is None:
+        raise HTTPException(status_code=404, detail="Run not found")
+    return run
+
+@app.get("/runs/{run_id}/top")
+def top_files(request: Request, run_id: str, metric: str = "cyclomatic_complexity", n: int = 10,
+              variant: str = "pre_refactor", strategy: str = "one_shot", order: str = "desc"):
+    """The n files of a run variant with the highest (or, with order=asc, lowest) value of metric."""
+    if metric not in TOP_METRICS:
+        raise HTTPException(status_code=400, detail=f"metric must be one of {', '.join(TOP_METRICS)}")
+    run_id, version = resolve_run(run_id)
+    files = run_store.top_files(run_id, variant, strategy, metric, max(1, min(n, TOP_FILES_MAX)), ascending=order == "asc")
+    return conditional_json(request, version, {"run_id": run_id, "variant": variant, "metric": metric, "files": files})
+
+@app.get("/files")
+def list_files(request: Request, run_id: Optional[str] = None, variant: str = "pre_refactor", strategy: str = "one_shot",
+               cursor: int = 0, limit: int = FILES_PAGE_SIZE, fields: Optional[str] = None):
+    """
+    Pages through the files of one variant of a run (by default the latest completed
+    run). Code and suggestions are blob references (see /blobs); pass fields
+    (e.g. fields=file_name,cyclomatic_complexity) to receive only those fields.
+    next_cursor is null on the last page.
+    """
+    run_id, version = resolve_run(run_id)
+    cursor = max(0, cursor)
+    limit = max(1, min(limit, FILES_MAX_PAGE_SIZE))
+    total, page, next_cursor = run_store.list_files(run_id, variant, strategy, cursor, limit)
+    return conditional_json(request, version, {
+        "run_id": run_id,
+        "variant": variant,
+        "strategy": None if variant == "pre_refactor" else strategy,
+        "total": total,
+        "next_cursor": next_cursor,
+        "files": [project_file(f, fields) for f in page]
+    })
+
+@app.get("/files/{file_id}")
+def get_file(request: Request, file_id: str, run_id: Optional[str] = None, variant: str = "pre_refactor",
+             strategy: str = "one_shot", fields: Optional[str] = None, expand: bool = True):
+    """One file's entry in a run variant, with its code and suggestions inlined unless expand=false."""
+    run_id, version = resolve_run(run_id)
+    file_metrics = run_store.get_file(run_id, variant, strategy, file_id)
+    if file_metrics is None:
+        raise HTTPException(status_code=404, detail="File not found")
+    projected = project_file(file_metrics, fields)
+    return conditional_json(request, version, expand_blobs(projected, blob_store) if expand else projected)
+
+@app.get("/blobs/{digest}")
+def get_blob(digest: str):
+    try:
+        return PlainTextResponse(blob_store.get(digest))
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Blob not found")
 
 
 @app.post("/analyze")
-async def analyze(request: AnalyzeRequest):
+def analyze(request: AnalyzeRequest):
     try:
         return analyze_project(request.project_dir, request.source_files)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/refactor")
-async def refactor(request: RefactorRequest):
+def refactor(request: RefactorRequest):
     try:
         return refactor_files(request.analysis_results, request.project_dir)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/report")
-async def report(request: ReportRequest):
+def report(request: ReportRequest):
     try:
         report_json = generate_report(request.analysis_results, project_name=request.project_name)
         return JSONResponse(content=json.loads(report_json))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/cache/stats")
+def cache_stats():
+    return {"tools": tool_cache.stats(), "llm": llm_cache.stats()}
+
 @app.get("/health")
 async def health_check():
     return {"status": "ok"}
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+import argparse
+import os
+import tempfile
+import time
+
+from analysis import analyze_project
+from tool_cache import tool_cache
+
+MODULE_TEMPLATE = """module Bench.M{index} where
+
+sumList{index} :: [Int] -> Int
+sumList{index} [] = 0
+sumList{index} (x : xs) = x + sumList{index} xs
+
+classify{index} :: Int -> String
+classify{index} n
+  | n < 0 = "negative"
+  | n == 0 = "zero"
+  | n > 100 = "large"
+  | otherwise = if even n then "even" else "odd"
+
+describe{index} :: Maybe Int -> String
+describe{index} m = case m of
+  Nothing -> "nothing"
+  Just v -> classify{index} (sumList{index} (map (\\x -> x * 2) [v, v + 1]))
+"""
+
+def write_corpus(corpus_dir, modules):
+    """Writes `modules` synthetic Haskell modules under corpus_dir/pre_refactor."""
+    project_dir = os.path.join(corpus_dir, "pre_refactor")
+    os.makedirs(os.path.join(project_dir, "Bench"))
+    source_files = []
+    for index in range(modules):
+        file_path = os.path.join(project_dir, "Bench", f"M{index}.hs")
+        with open(file_path, "w") as f:
+            f.write(MODULE_TEMPLATE.format(index=index))
+        source_files.append(file_path)
+    return source_files, project_dir
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Measure analyze_project wall-clock time for increasing worker counts on a synthetic corpus."
+    )
+    parser.add_argument("--modules", type=int, default=64, help="Number of synthetic modules to generate")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8, 16],
+                        help="Worker counts to benchmark")
+    parser.add_argument("--use-cache", action="store_true",
+                        help="Keep the tool result cache enabled (later runs then measure cache hits)")
+    args = parser.parse_args()
+    tool_cache.enabled = args.use_cache
+
+    with tempfile.TemporaryDirectory() as corpus_dir:
+        source_files, project_dir = write_corpus(corpus_dir, args.modules)
+
+        print(f"{'Workers':>8} {'Seconds':>10} {'Speedup':>9}")
+        print("-" * 29)
+        baseline = None
+        for workers in args.workers:
+            start = time.perf_counter()
+            analyze_project(project_dir, source_files, workers=workers)
+            elapsed = time.perf_counter() - start
+            baseline = baseline or elapsed
+            print(f"{workers:8} {elapsed:10.2f} {baseline / elapsed:8.2f}x")
+
+if __name__ == "__main__":
+    main()
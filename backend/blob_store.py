@@ -0,0 +1,41 @@
+# blob_store.py
+import gzip
+import hashlib
+import os
+import re
+import threading
+
+BLOB_STORE_DIR = os.getenv("BLOB_STORE_DIR", "project_result/blobs")
+BLOB_DIGEST = re.compile(r"^[0-9a-f]{64}$")
+
+class BlobStore:
+    """
+    Content-addressed text store: every distinct blob is written once,
+    gzip-compressed, under root/<first two hex digits>/<sha256>.gz.
+    """
+    def __init__(self, root):
+        self.root = root
+
+    def path(self, digest):
+        return os.path.join(self.root, digest[:2], digest + ".gz")
+
+    def put(self, text):
+        data = text.encode()
+        digest = hashlib.sha256(data).hexdigest()
+        path = self.path(digest)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with gzip.open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        return digest
+
+    def get(self, digest):
+        """Returns the blob's text; raises KeyError for malformed or unknown digests."""
+        if not BLOB_DIGEST.match(digest) or not os.path.exists(self.path(digest)):
+            raise KeyError(digest)
+        with gzip.open(self.path(digest), "rb") as f:
+            return f.read().decode()
+
+blob_store = BlobStore(BLOB_STORE_DIR)
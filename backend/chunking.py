@@ -0,0 +1,151 @@
+# chunking.py
+import os
+import re
+
+# Modules up to this many lines go to the LLM whole; larger ones are split into chunks
+# of consecutive top-level declaration groups of at most this many lines
+# (a single declaration longer than that becomes a chunk of its own).
+LLM_CHUNK_LINES = int(os.getenv("LLM_CHUNK_LINES", 300))
+# Upper bound on the chunks sent per module, hottest first; 0 sends them all.
+LLM_MAX_CHUNKS = int(os.getenv("LLM_MAX_CHUNKS", 0))
+
+HEADER_LINE = re.compile(r"^(module\b|import\b|\{-#|#)")
+DECL_KEYWORDS = {"data", "newtype", "type", "class", "instance", "deriving", "foreign", "infixl", "infixr", "infix"}
+# HLint locations: "path:(12,1)-(14,30)" for spans, "path:12:1-30" for single lines
+HLINT_SPAN = re.compile(r":\((\d+),\d+\)-\((\d+),\d+\)$")
+HLINT_LINE = re.compile(r":(\d+):\d+(?:-\d+)?$")
+
+def declaration_name(line):
+    tokens = re.findall(r"\([^\s()]+\)|[^\s(),:=]+", line)
+    if not tokens:
+        return line
+    if tokens[0] in DECL_KEYWORDS and len(tokens) > 1:
+        return f"{tokens[0]} {tokens[1]}"
+    return tokens[0]
+
+def top_level_lines(lines):
+    """Yields the indexes of lines that start a top-level item (column 0, outside comments)."""
+    comment_depth = 0
+    for index, line in enumerate(lines):
+        starts_item = (
+            comment_depth == 0 and line[:1].strip()
+            and not line.startswith("--") and not line.startswith("{-")
+        )
+        comment_depth = max(0, comment_depth + line.count("{-") - line.count("-}"))
+        if starts_item:
+            yield index
+
+def split_declarations(code):
+    """
+    Splits a module into its header (pragmas, module line, imports) and the
+    list of top-level declaration groups that follow it. A group is a type
+    signature together with the equations of the same name; comments directly
+    above a declaration go with it. Groups are (start, end) 0-based line ranges.
+    """
+    lines = code.splitlines()
+    starts = list(top_level_lines(lines))
+    body_start = next((index for index in starts if not HEADER_LINE.match(lines[index])), len(lines))
+    while body_start > 0 and lines[body_start - 1].startswith("--"):
+        body_start -= 1
+    starts = [index for index in starts if index >= body_start]
+
+    boundaries = []
+    previous_name = None
+    for index in starts:
+        name = declaration_name(lines[index])
+        if name != previous_name:
+            # Pull the comment lines right above the declaration into its group
+            while index > body_start and lines[index - 1].startswith("--") and (not boundaries or index - 1 > boundaries[-1]):
+                index -= 1
+            boundaries.append(index)
+        previous_name = name
+    if boundaries:
+        boundaries[0] = body_start
+    groups = [(start, end) for start, end in zip(boundaries, boundaries[1:] + [len(lines)])]
+    return "\n".join(lines[:body_start]), groups
+
+def hot_lines(suggestions, declarations):
+    """
+    Weights for 1-based source lines: one per HLint suggestion covering the line, plus the
+    cyclomatic complexity of each homplexity declaration record at its first line.
+    """
+    heat = {}
+    for s in suggestions:
+        span = HLINT_SPAN.search(s["location"])
+        single = HLINT_LINE.search(s["location"])
+        if span:
+            first, last = int(span.group(1)), int(span.group(2))
+        elif single:
+            first = last = int(single.group(1))
+        else:
+            continue
+        for line in range(first, last + 1):
+            heat[line] = heat.get(line, 0) + 1
+    for declaration in declarations or []:
+        if declaration.get("cyclomatic_complexity"):
+            heat[declaration["line"]] = heat.get(declaration["line"], 0) + declaration["cyclomatic_complexity"]
+    return heat
+
+def suggestion_line(suggestion):
+    span = HLINT_SPAN.search(suggestion["location"])
+    single = HLINT_LINE.search(suggestion["location"])
+    match = span or single
+    return int(match.group(1)) if match else None
+
+def plan_chunks(code, suggestions, declarations=None, max_lines=LLM_CHUNK_LINES, max_chunks=LLM_MAX_CHUNKS):
+    """
+    Splits a module into LLM requests. Returns a list of chunks, hottest first:
+    {"header", "start", "end", "text", "suggestions", "heat"} with 1-based,
+    inclusive line numbers. Each chunk carries only the suggestions located in
+    it (plus any without a usable location). A module that fits in max_lines,
+    or that has no top-level declarations to split at, is returned as one chunk
+    with an empty header.
+    """
+    lines = code.splitlines()
+    heat = hot_lines(suggestions, declarations)
+    whole_module = [{
+        "header": "", "start": 1, "end": len(lines), "text": code,
+        "suggestions": suggestions, "heat": sum(heat.values())
+    }]
+    if len(lines) <= max_lines:
+        return whole_module
+
+    header, groups = split_declarations(code)
+    if not groups:
+        return whole_module
+    spans = []
+    for start, end in groups:
+        if spans and end - spans[-1][0] <= max_lines:
+            spans[-1] = (spans[-1][0], end)
+        else:
+            spans.append((start, end))
+
+    chunks = []
+    for start, end in spans:
+        chunk_suggestions = [
+            s for s in suggestions
+            if suggestion_line(s) is None or start < suggestion_line(s) <= end
+        ]
+        chunks.append({
+            "header": header,
+            "start": start + 1,
+            "end": end,
+            "text": "\n".join(lines[start:end]),
+            "suggestions": chunk_suggestions,
+            "heat": sum(weight for line, weight in heat.items() if start < line <= end)
+        })
+    chunks.sort(key=lambda chunk: -chunk["heat"])
+    return chunks[:max_chunks] if max_chunks else chunks
+
+def merge_candidates(candidate_lists):
+    """Concatenates per-chunk candidates, dropping repeats of the same target/suggestion pair."""
+    merged = []
+    seen = set()
+    for candidates in candidate_lists:
+        for candidate in candidates:
+            key = (candidate.get("target_snippet", ""), candidate.get("refactored_suggestion", ""))
+            if key in seen:
+                continue
+            seen.add(key)
+            merged.append(candidate)
+    return merged
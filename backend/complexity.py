@@ -0,0 +1,247 @@
+# complexity.py
+import re
+
+from chunking import split_declarations, declaration_name, DECL_KEYWORDS
+
+# Identifiers (with primes), runs of operator symbols, and any other single character
+TOKEN = re.compile(r"[A-Za-z_][\w']*|[!#$%&*+./<=>?@\\^|~:-]+|\S")
+OPERATOR_CHARS = set("!#$%&*+./<=>?@\\^|~:-")
+MODULE_NAME = re.compile(r"^module\s+([\w.]+)", re.MULTILINE)
+# Type signature heads, including ones that declare several names ("f, g :: Int")
+SIGNATURE_NAME = r"(?:\([^()\s]+\)|[a-z_][\w']*)"
+SIGNATURE_HEAD = re.compile(rf"^({SIGNATURE_NAME}(?:\s*,\s*{SIGNATURE_NAME})*)\s*::")
+# Characters str.splitlines() breaks at; kept as they are so the blanked code has the same lines
+LINE_BREAKS = set("\n\r\x0b\x0c\x1c\x1d\x1e\x85\u2028\u2029")
+
+def blank_comments_and_strings(code):
+    """
+    Replaces comments, pragmas, string and character literals with spaces,
+    keeping line breaks and columns intact so the layout can still be read.
+    """
+    out = list(code)
+    i = 0
+    n = len(code)
+    depth = 0
+    while i < n:
+        c = code[i]
+        if depth or code.startswith("{-", i):
+            if code.startswith("{-", i):
+                depth += 1
+                out[i] = out[i + 1] = " "
+                i += 2
+            elif code.startswith("-}", i):
+                depth -= 1
+                out[i] = out[i + 1] = " "
+                i += 2
+            else:
+                if c != "\n":
+                    out[i] = " "
+                i += 1
+            continue
+        if code.startswith("--", i):
+            end = i
+            while end < n and code[end] == "-":
+                end += 1
+            # "-->" and friends are operators, not comments
+            if end >= n or code[end] not in OPERATOR_CHARS:
+                while i < n and code[i] != "\n":
+                    out[i] = " "
+                    i += 1
+                continue
+            i = end
+            continue
+        if c == '"':
+            out[i] = " "
+            i += 1
+            while i < n and code[i] != '"' and code[i] != "\n":
+                if code[i] == "\\" and i + 1 < n:
+                    out[i] = " "
+                    i += 1
+                out[i] = " "
+                i += 1
+            if i < n and code[i] == '"':
+                out[i] = " "
+                i += 1
+            continue
+        if c == "'" and (i == 0 or not (code[i - 1].isalnum() or code[i - 1] in "_'")):
+            literal = re.match(r"'(\\[^']+|[^'\\\n])'", code[i:])
+            if literal:
+                for j in range(i, i + literal.end()):
+                    out[j] = " "
+                i += literal.end()
+                continue
+        i += 1
+    return "".join(code[index] if c in LINE_BREAKS else out[index] for index, c in enumerate(code))
+
+def unliterate(code):
+    """Keeps only the code of a literate Haskell source (bird tracks or \\begin{code} blocks), one output line per input line."""
+    lines = []
+    in_code = False
+    for line in code.splitlines():
+        if line.strip() == "\\begin{code}":
+            in_code = True
+            lines.append("")
+        elif line.strip() == "\\end{code}":
+            in_code = False
+            lines.append("")
+        elif in_code:
+            lines.append(line)
+        elif line.startswith(">"):
+            lines.append(line[2:] if line.startswith("> ") else line[1:])
+        else:
+            lines.append("")
+    return "\n".join(lines)
+
+def branch_metrics(lines):
+    """
+    Reads the layout of one declaration and returns (decision_points, branching_depth).
+    Decision points: every `if`, each case alternative and each guard beyond the
+    first of its group. Depth is the deepest nesting of case/if/guard constructs.
+    """
+    decisions = 0
+    depth = 0
+    # Open constructs: {"kind", "column" (alternative column, None until known), "close" (indent that ends it), "alternatives"}
+    contexts = []
+    awaiting_alternatives = None
+
+    def close(context):
+        nonlocal decisions
+        if context["kind"] in ("case", "guard"):
+            decisions += max(0, context["alternatives"] - 1)
+
+    for line in lines:
+        tokens = [(m.start(), m.group()) for m in TOKEN.finditer(line)]
+        if not tokens:
+            continue
+        indent, first = tokens[0]
+        counted = False
+        while contexts:
+            top = contexts[-1]
+            if top["column"] is not None and indent == top["column"] and (top["kind"] == "case" or first == "|"):
+                top["alternatives"] += 1
+                counted = True
+                break
+            if indent <= top["close"] or (top["column"] is not None and indent < top["column"]):
+                close(contexts.pop())
+                continue
+            if top["kind"] == "guard" and top["column"] is None and first == "|":
+                top["column"] = indent
+                top["alternatives"] += 1
+                counted = True
+            break
+        if first == "|" and not counted:
+            contexts.append({"kind": "guard", "column": indent, "close": indent, "alternatives": 1})
+
+        brackets = 0
+        for index, (column, token) in enumerate(tokens):
+            if awaiting_alternatives is not None:
+                contexts.append({"kind": "case", "column": column, "close": awaiting_alternatives, "alternatives": 1})
+                awaiting_alternatives = None
+            if token in ("(", "["):
+                brackets += 1
+            elif token in (")", "]"):
+                brackets = max(0, brackets - 1)
+            elif token == "of" or (token == "case" and index > 0 and tokens[index - 1][1] == "\\"):
+                awaiting_alternatives = indent
+            elif token == "if":
+                if index + 1 < len(tokens) and tokens[index + 1][1] == "|":
+                    continue  # multi-way if: its alternatives are counted as guards
+                decisions += 1
+                contexts.append({"kind": "if", "column": None, "close": indent, "alternatives": 1})
+            elif token == "|" and index > 0 and brackets == 0:
+                top = contexts[-1] if contexts else None
+                if top and top["kind"] == "guard" and top["close"] == indent:
+                    top["alternatives"] += 1
+                else:
+                    contexts.append({"kind": "guard", "column": None, "close": indent, "alternatives": 1})
+        depth = max(depth, len(contexts))
+
+    while contexts:
+        close(contexts.pop())
+    return decisions, depth
+
+def signature_arguments(signature):
+    """Counts the arrows of a type signature outside brackets and after any context (=>); None without a `::`."""
+    if "::" not in signature:
+        return None
+    signature = signature.split("::", 1)[1]
+    if "=>" in signature:
+        signature = signature.split("=>")[-1]
+    arrows = 0
+    brackets = 0
+    for token in TOKEN.findall(signature):
+        if token in ("(", "["):
+            brackets += 1
+        elif token in (")", "]"):
+            brackets -= 1
+        elif token == "->" and brackets == 0:
+            arrows += 1
+    return arrows
+
+def function_metrics(code):
+    """
+    Per-declaration metrics for the top-level functions of a module:
+    a list of {"name", "line", "clauses", "lines_of_code", "cyclomatic_complexity",
+    "branching_depth", "signature_line", "arguments"}; line numbers are 1-based.
+    Cyclomatic complexity is 1 + (clauses - 1) + decision points, as homplexity counts it.
+    """
+    blanked = blank_comments_and_strings(code).splitlines()
+    _, groups = split_declarations(code)
+    # Signatures may come before or after the clauses they type, and one may type several names
+    signatures = {}
+    declarations = []
+    for start, end in groups:
+        code_lines = [index for index in range(start, end) if blanked[index].strip()]
+        heads = [index for index in code_lines if blanked[index][:1].strip()]
+        signature_lines = set()
+        clauses = []
+        for position, head in enumerate(heads):
+            match = SIGNATURE_HEAD.match(blanked[head])
+            if not match:
+                clauses.append(head)
+                continue
+            # A signature runs until the next top-level line of its group
+            next_head = heads[position + 1] if position + 1 < len(heads) else end
+            lines = [index for index in code_lines if head <= index < next_head]
+            signature_lines.update(lines)
+            for name in re.split(r"\s*,\s*", match.group(1)):
+                signatures.setdefault(name, (head, " ".join(blanked[index] for index in lines)))
+        declarations.append((code_lines, signature_lines, clauses))
+
+    functions = []
+    for code_lines, signature_lines, clauses in declarations:
+        if not clauses:
+            continue
+        name = declaration_name(blanked[clauses[0]])
+        if name.split(" ")[0] in DECL_KEYWORDS:
+            continue
+        body = [blanked[index] for index in code_lines if index not in signature_lines]
+        decisions, depth = branch_metrics(body)
+        signature = signatures.get(name)
+        functions.append({
+            "name": name,
+            "line": clauses[0] + 1,
+            "clauses": len(clauses),
+            "lines_of_code": len(body),
+            "cyclomatic_complexity": 1 + (len(clauses) - 1) + decisions,
+            "branching_depth": depth,
+            "signature_line": signature[0] + 1 if signature else None,
+            "arguments": signature_arguments(signature[1]) if signature else None
+        })
+    return functions
+
+def homplexity_report(code, file_path):
+    """Renders function_metrics in homplexity-cli's output format, so it can be parsed like the real tool's output."""
+    module = MODULE_NAME.search(code)
+    module_loc = sum(1 for line in blank_comments_and_strings(code).splitlines() if line.strip())
+    report = [f'Info:SrcLoc "{file_path}" 1 1:module {module.group(1) if module else "Main"} has {module_loc} lines of code']
+    for function in function_metrics(code):
+        location = f'SrcLoc "{file_path}" {function["line"]} 1'
+        if function["arguments"] is not None:
+            report.append(
+                f'Debug:SrcLoc "{file_path}" {function["signature_line"]} 1:type signature for {function["name"]} has {function["arguments"]} arguments'
+            )
+        report.append(f'Debug:{location}:function {function["name"]} has {function["lines_of_code"]} lines of code')
+        report.append(f'Debug:{location}:function {function["name"]} has cyclomatic complexity of {function["cyclomatic_complexity"]}')
+        report.append(f'Info:{location}:function {function["name"]} has branching depth of {function["branching_depth"]}')
+    return "\n".join(report) + "\n"
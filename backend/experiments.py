@@ -0,0 +1,215 @@
+# experiments.py
+import logging
+import os
+from pathlib import Path
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from analysis import ANALYSIS_WORKERS
+from chunking import plan_chunks, merge_candidates
+from llm_client import LLM_CONCURRENCY
+from project_ingestion import build_import_graph, topological_order, materialize_variant_tree
+from refactor import LLM_MODELS, static_refactor, analyze_suggestions, apply_candidates, evaluate_refactored_files
+from scratch import ScratchWorkspace
+
+VARIANTS = ("static", "llm_only", "hybrid")
+STRATEGIES = ("zero_shot", "one_shot", "chain_of_thought")
+# Analyzer prompt of each prompting strategy
+PROMPT_FILES = {
+    "zero_shot": "analyzer_agent_prompt_zero_shot.txt",
+    "one_shot": "analyzer_agent_prompt_d.txt",
+    "chain_of_thought": "analyzer_agent_prompt_cot.txt",
+}
+DEFAULT_MODEL = "model2"
+# Cells run by the ingest pipeline: "all", or comma-separated variant:strategy[:model]
+EXPERIMENT_CELLS = os.getenv("EXPERIMENT_CELLS", "static:one_shot,hybrid:one_shot")
+# Refactored trees evaluated at the same time (each evaluation runs ANALYSIS_WORKERS tool processes).
+EXPERIMENT_WORKERS = int(os.getenv("EXPERIMENT_WORKERS", 2))
+
+def parse_cells(spec):
+    """Parses a cell list ("all", or e.g. "static:one_shot,hybrid:zero_shot:model1") into (variant, strategy, model) tuples."""
+    if spec.strip() == "all":
+        return [(variant, strategy, DEFAULT_MODEL) for variant in VARIANTS for strategy in STRATEGIES]
+    cells = []
+    for item in spec.split(","):
+        parts = item.strip().split(":")
+        if len(parts) not in (2, 3) or parts[0] not in VARIANTS or parts[1] not in STRATEGIES:
+            raise ValueError(f"Invalid experiment cell {item.strip()!r}; expected variant:strategy[:model]")
+        if len(parts) == 3 and parts[2] not in LLM_MODELS:
+            raise ValueError(f"Unknown model in experiment cell {item.strip()!r}; expected one of {', '.join(LLM_MODELS)}")
+        cell = (parts[0], parts[1], parts[2] if len(parts) == 3 else DEFAULT_MODEL)
+        if cell not in cells:
+            cells.append(cell)
+    return cells
+
+def cell_label(strategy, model):
+    """Key of a cell under its variant in post_refactor: the strategy, suffixed with the model unless it is the default one."""
+    return strategy if model == DEFAULT_MODEL else f"{strategy}:{model}"
+
+def read_prompt(strategy):
+    try:
+        with open(PROMPT_FILES[strategy], "r") as f:
+            return f.read()
+    except Exception as e:
+        logging.warning("Error reading analyzer prompt: %s", e)
+        return ""
+
+def cell_tree(pre_files, project_dir, variant, strategy, model):
+    """
+    Maps every pre-refactor file to its path in the cell's refactored tree. Static
+    cells and one-shot cells of the default model use the trees made at ingestion;
+    any other cell gets its own hardlinked copy of pre_refactor.
+    """
+    if variant == "static" or (strategy == "one_shot" and model == DEFAULT_MODEL):
+        return {f["file_name"]: f["refactored_code"][f"{variant}_refactored_file"] for f in pre_files}
+    pre_dir = Path(project_dir)
+    cell_dir = pre_dir.parent / f"{variant}_{strategy}_{model}_refactored"
+    if not cell_dir.exists():
+        materialize_variant_tree(str(pre_dir), str(cell_dir))
+    return {f["file_name"]: str(cell_dir / Path(f["file_name"]).relative_to(pre_dir)) for f in pre_files}
+
+def run_experiments(analysis_results, project_dir, cells=None, progress=None, on_file=None):
+    """
+    Fills the post_refactor matrix for the given (variant, strategy, model) cells
+    (default: EXPERIMENT_CELLS) from the one baseline analysis in analysis_results.
+
+    Work shared between cells is done once: `hlint --refactor` and the static
+    suggestions feed every cell, and all static cells share one evaluated tree
+    (strategy and model do not apply to them). The LLM requests of every LLM cell
+    go through one pool of LLM_CONCURRENCY workers; each cell's tree is evaluated
+    as soon as its last file is in, at most EXPERIMENT_WORKERS at a time.
+
+    A failing LLM request only costs the candidates of its chunk, and a failing
+    evaluation only its own cell: the other cells still run to completion. A cell
+    whose requests failed lists them under "errors"; a cell whose evaluation
+    failed is left with empty overall and files plus the "error".
+
+    progress, if given, is called as progress(files_done, files_total) over the
+    (LLM cell, file) pairs; on_file as on_file(variant, cell_label, file_metrics).
+    Returns {variant: {cell_label: {"overall": ..., "files": [...]}}}.
+    """
+    cells = cells or parse_cells(EXPERIMENT_CELLS)
+    pre_files = analysis_results["pre_refactor"]["files"]
+    import_graph = analysis_results.get("import_graph") or build_import_graph([f["file_name"] for f in pre_files])
+    # Refactor dependencies before the modules that import them
+    position = {file_name: index for index, file_name in enumerate(topological_order(import_graph))}
+    file_order = {f["file_name"]: index for index, f in enumerate(pre_files)}
+    ordered_files = sorted(pre_files, key=lambda f: position.get(f["file_name"], len(position)))
+
+    # --- Static suggestions and `hlint --refactor`, every file in its own scratch path ---
+    with ScratchWorkspace(prefix="static_") as workspace, ThreadPoolExecutor(max_workers=ANALYSIS_WORKERS) as pool:
+        static_outputs = list(pool.map(partial(static_refactor, workspace=workspace), ordered_files))
+    static_suggestions_by_file = {file["file_name"]: suggestions for file, (suggestions, _) in zip(ordered_files, static_outputs)}
+    # Report files in their original order
+    static_entries = sorted((entry for _, entry in static_outputs), key=lambda entry: file_order[entry["file_name"]])
+
+    static_labels = [cell_label(strategy, model) for variant, strategy, model in cells if variant == "static"]
+    llm_cells = [cell for cell in cells if cell[0] != "static"]
+
+    def publish(variant, labels):
+        if not on_file:
+            return None
+        def publish_file(file_metrics):
+            for label in labels:
+                on_file(variant, label, file_metrics)
+        return publish_file
+
+    post_refactor = {}
+    with ThreadPoolExecutor(max_workers=EXPERIMENT_WORKERS) as evaluations, \
+            ThreadPoolExecutor(max_workers=LLM_CONCURRENCY) as llm_pool:
+        evaluated = {}
+        if static_labels:
+            tree = cell_tree(pre_files, project_dir, "static", None, None)
+            future = evaluations.submit(
+                evaluate_refactored_files, static_entries, tree, pre_files, import_graph,
+                on_file=publish("static", static_labels)
+            )
+            evaluated[future] = ("static", static_labels, [])
+
+        # --- LLM cells (llm_only: no static suggestions; hybrid: with them) ---
+        # Large modules are split into declaration chunks that are analyzed independently
+        pending = {}
+        cell_state = {}
+        for cell in llm_cells:
+            variant, strategy, model = cell
+            prompt = read_prompt(strategy)
+            cell_state[cell] = {
+                "tree": cell_tree(pre_files, project_dir, variant, strategy, model),
+                "files_left": len(pre_files), "entries": [], "errors": []
+            }
+            for file in ordered_files:
+                suggestions = static_suggestions_by_file[file["file_name"]] if variant == "hybrid" else []
+                chunks = plan_chunks(file["original_code"], suggestions, file.get("homplexity_analysis", {}).get("declarations", []))
+                chunk_results = {"expected": len(chunks), "candidates": []}
+                for chunk in chunks:
+                    future = llm_pool.submit(
+                        analyze_suggestions, prompt, chunk["suggestions"], file["original_code"],
+                        project_dir, chunk if len(chunks) > 1 else None, model
+                    )
+                    pending[future] = (cell, file, chunk, chunk_results)
+
+        files_done = 0
+        files_total = len(pre_files) * len(llm_cells)
+        for future in as_completed(pending):
+            cell, file, chunk, chunk_results = pending[future]
+            try:
+                candidates = future.result()
+            except Exception as e:
+                logging.warning("LLM analysis of %s (lines %s-%s) for cell %s failed: %s",
+                                file["file_name"], chunk["start"], chunk["end"], ":".join(cell), e)
+                cell_state[cell]["errors"].append(f"{file['file_name']}:{chunk['start']}-{chunk['end']}: {e}")
+                candidates = []
+            chunk_results["candidates"].append((chunk["start"], candidates))
+            if len(chunk_results["candidates"]) < chunk_results["expected"]:
+                continue
+            files_done += 1
+            state = cell_state[cell]
+            original_code = file["original_code"]
+            file_name = file["file_name"]
+            final_candidates_combined = merge_candidates(
+                candidates for _, candidates in sorted(chunk_results["candidates"], key=lambda result: result[0])
+            )
+
+            if final_candidates_combined:
+                updated_code_combined, _, skipped_candidates = apply_candidates(original_code, final_candidates_combined)
+
+                refactored_file = state["tree"][file_name]
+                os.remove(refactored_file)
+                # Write the code to the cell's refactored directory file
+                with open(refactored_file, "w") as f:
+                    f.write(updated_code_combined)
+
+                state["entries"].append({
+                    "file_name": file_name,
+                    "refactored_file_name": refactored_file,
+                    "original_code": original_code,
+                    "suggestions": final_candidates_combined,
+                    "skipped_candidates": skipped_candidates,
+                    "refactored_code": updated_code_combined
+                })
+
+            if progress:
+                progress(files_done, files_total)
+
+            state["files_left"] -= 1
+            if state["files_left"] == 0:
+                variant, strategy, model = cell
+                label = cell_label(strategy, model)
+                state["entries"].sort(key=lambda entry: file_order[entry["file_name"]])
+                evaluation = evaluations.submit(
+                    evaluate_refactored_files, state["entries"], state["tree"], pre_files, import_graph,
+                    on_file=publish(variant, [label])
+                )
+                evaluated[evaluation] = (variant, [label], state["errors"])
+
+        for future, (variant, labels, errors) in evaluated.items():
+            try:
+                results = future.result()
+            except Exception as e:
+                logging.warning("Evaluation of %s cells %s failed: %s", variant, ", ".join(labels), e)
+                results = {"overall": {}, "files": [], "error": str(e)}
+            if errors:
+                results["errors"] = errors
+            for label in labels:
+                post_refactor.setdefault(variant, {})[label] = results
+    return post_refactor
@@ -0,0 +1,164 @@
+# ghci_pool.py
+import atexit
+import os
+import queue
+import subprocess
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+# Long-lived `ghci -fno-code` sessions kept warm for type checks.
+GHCI_POOL_SIZE = int(os.getenv("GHCI_POOL_SIZE", 2))
+# A session is restarted after this many loads, or once its resident memory exceeds GHCI_MAX_RSS_MB.
+GHCI_MAX_LOADS = int(os.getenv("GHCI_MAX_LOADS", 200))
+GHCI_MAX_RSS_MB = int(os.getenv("GHCI_MAX_RSS_MB", 1536))
+# Seconds a session may take to answer one command before it is considered hung.
+GHCI_TIMEOUT = float(os.getenv("GHCI_TIMEOUT", 120))
+GHCI_FLAGS = ["-fno-code", "-keep-going", "-ignore-dot-ghci", "-fdiagnostics-color=never"]
+
+def ghci_quote(arg):
+    """Quotes one argument of a GHCi command as a Haskell string, so paths may contain spaces."""
+    return '"' + arg.replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+class GhciError(Exception):
+    """A session exited or did not answer within GHCI_TIMEOUT."""
+
+class GhciSession:
+    """
+    One ghci process driven over stdin/stdout. Its prompt is set to a random
+    sentinel line, so the output of a command is everything printed before the
+    next prompt; stderr is merged into stdout to keep diagnostics in order.
+    """
+    def __init__(self):
+        self.sentinel = f"#~ghci-ready-{uuid.uuid4().hex}~#"
+        self.process = subprocess.Popen(
+            ["ghci"] + GHCI_FLAGS,
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+            text=True, bufsize=1
+        )
+        self.lines = queue.Queue()
+        threading.Thread(target=self._read, daemon=True).start()
+        self.loads = 0
+        self.loaded = None
+        try:
+            self.command(f':set prompt "{self.sentinel}\\n"')
+        except GhciError:
+            self.close()
+            raise
+
+    def _read(self):
+        for line in self.process.stdout:
+            self.lines.put(line.rstrip("\n"))
+        self.lines.put(None)
+
+    def command(self, text):
+        """Sends one GHCi command and returns its output."""
+        try:
+            self.process.stdin.write(text + "\n")
+            self.process.stdin.flush()
+        except OSError as e:
+            raise GhciError(f"ghci is not running: {e}")
+        output = []
+        deadline = time.monotonic() + GHCI_TIMEOUT
+        while True:
+            try:
+                line = self.lines.get(timeout=max(0, deadline - time.monotonic()))
+            except queue.Empty:
+                raise GhciError(f"ghci did not answer {text!r} within {GHCI_TIMEOUT}s")
+            if line is None:
+                raise GhciError(f"ghci exited with status {self.process.wait()}")
+            if line.endswith(self.sentinel):
+                # Output without a trailing newline ends up in front of the prompt
+                if line[:-len(self.sentinel)]:
+                    output.append(line[:-len(self.sentinel)])
+                return "\n".join(output)
+            output.append(line)
+
+    def check(self, files, include_dirs=()):
+        """
+        Type-checks files and the local modules they import; returns GHC's output.
+        Checking the same files again only `:reload`s, so unchanged modules are skipped.
+        """
+        target = (tuple(files), tuple(include_dirs))
+        if self.loaded == target:
+            output = self.command(":reload")
+        else:
+            self.command(":set -i")
+            if include_dirs:
+                self.command(":set " + " ".join(ghci_quote("-i" + root) for root in include_dirs))
+            output = self.command(":load " + " ".join(ghci_quote(file) for file in files))
+            self.loaded = target
+        self.loads += 1
+        return output
+
+    def rss_mb(self):
+        """Resident memory of the session in MB, read from /proc; 0 where that is not available."""
+        try:
+            with open(f"/proc/{self.process.pid}/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        return int(line.split()[1]) / 1024
+        except OSError:
+            pass
+        return 0
+
+    def alive(self):
+        return self.process.poll() is None
+
+    def worn_out(self):
+        return self.loads >= GHCI_MAX_LOADS or self.rss_mb() > GHCI_MAX_RSS_MB
+
+    def close(self):
+        if self.alive():
+            try:
+                self.process.stdin.write(":quit\n")
+                self.process.stdin.flush()
+                self.process.wait(timeout=5)
+            except (OSError, subprocess.TimeoutExpired):
+                self.process.kill()
+                self.process.wait()
+
+class GhciPool:
+    """
+    Hands out up to `size` warm sessions at a time, starting them on first use.
+    A session is health-checked before every use and replaced if it has exited,
+    has done GHCI_MAX_LOADS loads or grown past GHCI_MAX_RSS_MB; a session that
+    raised during a check is closed rather than reused.
+    """
+    def __init__(self, size):
+        self.slots = threading.BoundedSemaphore(size)
+        self.idle = queue.LifoQueue()
+
+    @contextmanager
+    def session(self):
+        with self.slots:
+            try:
+                session = self.idle.get_nowait()
+            except queue.Empty:
+                session = None
+            if session is not None and (not session.alive() or session.worn_out()):
+                session.close()
+                session = None
+            if session is None:
+                session = GhciSession()
+            try:
+                yield session
+            except BaseException:
+                session.close()
+                raise
+            self.idle.put(session)
+
+    def check(self, files, include_dirs=()):
+        with self.session() as session:
+            return session.check(files, include_dirs)
+
+    def close(self):
+        while True:
+            try:
+                self.idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+ghci_pool = GhciPool(GHCI_POOL_SIZE)
+atexit.register(ghci_pool.close)
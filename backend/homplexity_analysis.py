@@ -1,167 +1,183 @@
+import logging
 import re
 import subprocess
-import streamlit as st
-import json
-import requests
+import os
+from complexity import homplexity_report, unliterate
+from tool_cache import tool_cache, cache_key, file_digest
 
-def run_homplexity_analysis(file_path):
-    cmd = ["homplexity-cli", "--severity", "Debug", file_path]
-    try:
-        result = subprocess.run(cmd, capture_output=True, text=True, check=True)
-    except subprocess.CalledProcessError as e:
-        # st.error(f"Homplexity failed on {file_path}:\n{e.stderr or e.stdout}")
-        # return {"cyclomatic_complexity": {"min":0,"max":0,"average":0,"sum":0}, "homplexity_loc" : 0, "homplexity_output": e.stderr or e.stdout}
-        OPENROUTER_API_KEY = "Your API Key"
-        with open(file_path, "r") as f:
-            code_to_analyze = f.read()
-        
-        response = requests.post(
-            url="https://openrouter.ai/api/v1/chat/completions",
-            headers={
-                "Authorization": f"Bearer {OPENROUTER_API_KEY}",
-                "Content-Type": "application/json"
-            },
-            # data=json.dumps({
-            #     "model": "openai/o3-mini-high",
-            #     "messages": [
-            #     {
-            #         "role": "user",
-            #         "content": """
-            #             "Analyze the following Haskell code and return a JSON object with the cyclomatic complexity of each function. "
-            #             "The JSON should have the function names as keys and their cyclomatic complexity as values. "
-            #             "Also, include the computed minimum, maximum, average, and sum of these values as additional keys (min, max, average, sum). "
-            #             "also caluculate how many Lines of code"
-            #             "Here is the code:\n\n" 
-            #             """ + code_to_analyze + """
-            #             "\n\nOutput your results in JSON format exactly as follows (do not output any additional text):"
-            #             "{"
-            #             "   \"cyclomatic_complexity\": {"
-            #             "       \"min\": 0,
-            #             "       \"max\": 0,
-            #             "       \"average\": 0,
-            #             "       \"sum\": 0
-            #             "   },"
-            #             "   \"homplexity_loc\" : 0,
-            #             "   \"homplexity_output\" : ""      
-            #             "}"
-            #         """
-            #     }
-            #     ],
-                
-            # })
-            data=json.dumps({
-                # "model": "openai/o3-mini-high",
-                "model": "openai/gpt-4o-2024-11-20",
-                "messages": [
-                    {
-                        "role": "system",
-                        "content": "You are a code analysis assistant specialized in Haskell. Analyze Haskell code and return JSON outputs. Do not return any additional explanation or text besides the JSON object. Your output must strictly follow the provided format."
-                    },
-                    {
-                        "role": "user",
-                        "content": (
-                            "Analyze the following Haskell code and return a JSON object with the cyclomatic complexity of each function. "
-                            "The JSON should have the function names as keys and their cyclomatic complexity as values. "
-                            "Also, include the computed minimum, maximum, average, and sum of these values as additional keys (min, max, average, sum). "
-                            "Also calculate how many Lines of Code are in the input. "
-                            "Here is the code:\n\n" + code_to_analyze + "\n\n"
-                            "Output your results in JSON format exactly as follows (do not output any additional text):\n"
-                            "{\n"
-                            '    "cyclomatic_complexity": {\n'
-                            '        "min": 0,\n'
-                            '        "max": 0,\n'
-                            '        "average": 0,\n'
-                            '        "sum": 0\n'
-                            "    },\n"
-                            '    "homplexity_loc": 0,\n'
-                            '    "homplexity_output": ""\n'
-                            "}"
-                        )
-                    }
-                ],
-            })
-        )
-        response.raise_for_status()
-        result = response.json()
+HOMPLEXITY_FLAGS = ["--severity", "Debug"]
+# Files passed to a single homplexity-cli invocation by run_homplexity_batch.
+HOMPLEXITY_BATCH_SIZE = int(os.getenv("HOMPLEXITY_BATCH_SIZE", 200))
+# "cli" runs homplexity-cli and falls back to the native estimator when it fails;
+# "native" skips homplexity-cli and always uses the estimator in complexity.py.
+HOMPLEXITY_MODE = os.getenv("HOMPLEXITY_MODE", "cli")
+# The parsed per-declaration records are always stored; the raw text only on request.
+HOMPLEXITY_KEEP_OUTPUT = os.getenv("HOMPLEXITY_KEEP_OUTPUT", "0") == "1"
+# Part of the cache key: bumped whenever the shape of the cached result changes
+HOMPLEXITY_RESULT_FORMAT = "records-2" + ("+output" if HOMPLEXITY_KEEP_OUTPUT else "")
+
+# Severity:SrcLoc "file" line column:message
+HOMPLEXITY_LINE = re.compile(r'^\w+:SrcLoc "[^"]*" (\d+) (\d+):\s*(.*)$')
+HOMPLEXITY_FILE = re.compile(r'^\w+:SrcLoc "([^"]*)" \d+ \d+:')
+HOMPLEXITY_METRICS = [
+    (re.compile(r"function (\S+) has cyclomatic complexity of (\d+)"), "cyclomatic_complexity"),
+    (re.compile(r"function (\S+) has branching depth of (\d+)"), "branching_depth"),
+    (re.compile(r"function (\S+) has (\d+) lines of code"), "lines_of_code"),
+    (re.compile(r"type signature for (\S+) has (\d+) arguments"), "signature_arguments"),
+    (re.compile(r"type signature for (\S+) has type constructor nesting depth of (\d+)"), "signature_depth"),
+    (re.compile(r"type signature for (\S+) has depth of (\d+)"), "signature_depth"),
+    (re.compile(r"(\d+) lines of code"), "module_lines_of_code"),
+]
 
-        # The API returns the content as a JSON string, so we need to parse it.
-        if 'choices' not in result:
-            raise ValueError(f"Unexpected response format: {json.dumps(result, indent=2)}")
+def native_homplexity_analysis(file_path):
+    with open(file_path, "r") as f:
+        code = f.read()
+    if file_path.endswith(".lhs"):
+        code = unliterate(code)
+    try:
+        report = homplexity_report(code, file_path)
+    except Exception as e:
+        # An estimator bug costs this file its metrics, not the whole run
+        logging.warning("Could not estimate the complexity of %s: %s", file_path, e)
+        report = ""
+    return parse_homplexity_output(report)
 
-        content_str = result['choices'][0]['message']['content']
-        if content_str.startswith("```json"):
-            content_str = content_str.strip("```json").strip("```")
+def homplexity_cache_key(file_path):
+    return cache_key("homplexity-cli", HOMPLEXITY_FLAGS + [HOMPLEXITY_RESULT_FORMAT], [file_digest(file_path)])
 
-        try:
-            parsed_content = json.loads(content_str)
+def cached_homplexity(key, file_path):
+    cached = tool_cache.get(key)
+    if cached is None:
+        return None
+    homplexity_data = cached["homplexity_data"]
+    if HOMPLEXITY_KEEP_OUTPUT:
+        # The same content may have been measured under another path (e.g. a variant tree)
+        homplexity_data["homplexity_output"] = homplexity_data["homplexity_output"].replace(
+            f'SrcLoc "{cached["file_path"]}"', f'SrcLoc "{file_path}"'
+        )
+    return homplexity_data
 
-            cc = parsed_content.get("cyclomatic_complexity", {})
-            final_metrics = {
-                "cyclomatic_complexity": {
-                    "min": int(cc.get("min", 0)),
-                    "max": int(cc.get("max", 0)),
-                    "average": round(cc.get("average", 0)),
-                    "sum": int(cc.get("sum", 0)),
-                },
-                "homplexity_loc": int(parsed_content.get("homplexity_loc", 0)),
-                "homplexity_output": content_str
-            }
-            return final_metrics
-        except Exception as e:
-            # st.error("Error parsing JSON: " + str(e))
-            # raise ValueError(f"Failed to parse content as JSON: {content_str}") from e
-            # parsed_content = {}
-            return {
-                "cyclomatic_complexity": {"min": 0, "max": 0, "average": 0, "sum": 0},
-                "homplexity_loc": 0,
-                "homplexity_output": content_str  # helpful for debugging
-            }
+def run_homplexity_analysis(file_path):
+    if HOMPLEXITY_MODE == "native":
+        return native_homplexity_analysis(file_path)
+    key = homplexity_cache_key(file_path)
+    cached = cached_homplexity(key, file_path)
+    if cached is not None:
+        return cached
+    cmd = ["homplexity-cli"] + HOMPLEXITY_FLAGS + [file_path]
+    try:
+        result = subprocess.run(cmd, capture_output=True, text=True, check=True)
+    except (subprocess.CalledProcessError, OSError):
+        # homplexity-cli could not handle the file (or is not installed): estimate in-process
+        return native_homplexity_analysis(file_path)
+    homplexity_data = parse_homplexity_output(result.stdout)
+    tool_cache.put(key, {"file_path": file_path, "homplexity_data": homplexity_data})
+    return homplexity_data
 
-        # # Use parsed_content instead of directly indexing the string.
-        # st.success(parsed_content.get('cyclomatic_complexity', {}).get('sum', 'No sum found'))
+def run_homplexity_batch(file_paths):
+    """
+    Runs homplexity-cli once over the files of file_paths not found in the tool
+    cache and splits its output back out by the file of each SrcLoc. Files the
+    batch reports nothing for (e.g. ones homplexity cannot parse) are measured
+    on their own with run_homplexity_analysis.
+    Returns a dict mapping each input path to its homplexity data.
+    """
+    if HOMPLEXITY_MODE == "native":
+        return {file: native_homplexity_analysis(file) for file in file_paths}
+    results = {}
+    keys = {}
+    for file in file_paths:
+        key = homplexity_cache_key(file)
+        cached = cached_homplexity(key, file)
+        if cached is None:
+            keys[file] = key
+        else:
+            results[file] = cached
+    if not keys:
+        return results
 
-        # final_metrics = {
-        #     "cyclomatic_complexity": {
-        #         "min": int(parsed_content['cyclomatic_complexity']['min']),
-        #         "max": int(parsed_content['cyclomatic_complexity']['max']),
-        #         "average": round(parsed_content['cyclomatic_complexity']['average']),
-        #         "sum": int(parsed_content['cyclomatic_complexity']['sum'])
-        #     },
-        #     "homplexity_loc": int(parsed_content['homplexity_loc']),
-        #     "homplexity_output": content_str
-        # }
+    output_by_file = {file: [] for file in keys}
+    normalized = {os.path.normpath(file): file for file in keys}
+    cmd = ["homplexity-cli"] + HOMPLEXITY_FLAGS + list(keys)
+    try:
+        output = subprocess.run(cmd, capture_output=True, text=True).stdout
+    except OSError:
+        output = ""
+    for line in output.splitlines():
+        match = HOMPLEXITY_FILE.match(line.strip())
+        file = normalized.get(os.path.normpath(match.group(1))) if match else None
+        if file is not None:
+            output_by_file[file].append(line)
+    for file, lines in output_by_file.items():
+        if not lines:
+            results[file] = run_homplexity_analysis(file)
+            continue
+        results[file] = parse_homplexity_output("\n".join(lines) + "\n")
+        tool_cache.put(keys[file], {"file_path": file, "homplexity_data": results[file]})
+    return results
 
-        # return final_metrics
-        # response.raise_for_status()
-        # result = response.json()
-        # st.success(result['choices'][0]['message']['content']['cyclomatic_complexity']['sum'])
-        # return {
-        #     "cyclomatic_complexity": {
-        #         "min": int(result['choices'][0]['message']['content']['cyclomatic_complexity']['min']),
-        #         "max": int(result['choices'][0]['message']['content']['cyclomatic_complexity']['max']),
-        #         "average": round(result['choices'][0]['message']['content']['cyclomatic_complexity']['average']),
-        #         "sum": int(result['choices'][0]['message']['content']['cyclomatic_complexity']['sum'])
-        #     },
-        #     "homplexity_loc" : int(result['choices'][0]['message']['content']['homplexity_loc']),
-        #     "homplexity_output" : result['choices'][0]['message']['content']
-        # }
-        # return result['choices'][0]['message']['content']
-    output_text = result.stdout
+def parse_homplexity_output(output_text):
+    """
+    Parses homplexity output once into per-declaration records:
+    {"name", "line", "column", "cyclomatic_complexity", "branching_depth", "lines_of_code",
+    "signature_arguments", "signature_depth"} (fields a declaration was not reported for are None),
+    plus the aggregate CC/LOC figures and the deepest branching depth. The raw text is
+    only kept as homplexity_output when HOMPLEXITY_KEEP_OUTPUT is set.
+    """
+    # Declarations are told apart by their location, so same-named local functions stay separate
+    declarations = {}
     cc_values = []
     loc_values = []
+    depth_values = []
     for line in output_text.splitlines():
-        line = line.strip()
-        if not line or ":SrcLoc" not in line:
+        match = HOMPLEXITY_LINE.match(line.strip())
+        if not match:
             continue
-        # m = re.search(r'cyclomatic complexity of (\d+)', line)
-        m = re.search(r'cyclomatic complexity of (\d+)', line)
-        loc = re.search(r'(\d+) lines of code', line)
-        if m:
-            cc_values.append(int(m.group(1)))
-        if loc:
-            loc_values.append(int(loc.group(1)))
+        row, column, message = int(match.group(1)), int(match.group(2)), match.group(3)
+        for pattern, field in HOMPLEXITY_METRICS:
+            metric = pattern.search(message)
+            if not metric:
+                continue
+            if field == "module_lines_of_code":
+                loc_values.append(int(metric.group(1)))
+                break
+            name, value = metric.group(1), int(metric.group(2))
+            kind = "signature" if field.startswith("signature_") else "function"
+            if field == "cyclomatic_complexity":
+                cc_values.append(value)
+            elif field == "branching_depth":
+                depth_values.append(value)
+            elif field == "lines_of_code":
+                loc_values.append(value)
+            declaration = declarations.setdefault((kind, name, row, column), {
+                "name": name, "line": row, "column": column, "cyclomatic_complexity": None,
+                "branching_depth": None, "lines_of_code": None, "signature_arguments": None, "signature_depth": None
+            })
+            declaration[field] = value
+            break
+
+    # Attach each signature's metrics to the nearest function of that name at or below it,
+    # else the nearest one above (signatures without a function stay on their own)
+    by_position = lambda declaration: (declaration["line"], declaration["column"])
+    functions = sorted((d for (kind, *_), d in declarations.items() if kind == "function"), key=by_position)
+    signatures = sorted((d for (kind, *_), d in declarations.items() if kind == "signature"), key=by_position)
+    records = list(functions)
+    claimed = set()
+    for signature in signatures:
+        candidates = [index for index, f in enumerate(functions) if index not in claimed and f["name"] == signature["name"]]
+        following = [index for index in candidates if functions[index]["line"] >= signature["line"]]
+        # A signature may also be written after its function's first clause
+        function = following[0] if following else (candidates[-1] if candidates else None)
+        if function is None:
+            records.append(signature)
+            continue
+        claimed.add(function)
+        functions[function]["signature_arguments"] = signature["signature_arguments"]
+        functions[function]["signature_depth"] = signature["signature_depth"]
+    records.sort(key=lambda declaration: declaration["line"])
+
     if cc_values:
-        return {
+        homplexity_data = {
             "cyclomatic_complexity": {
                 "min": min(cc_values),
                 "max": max(cc_values),
@@ -169,7 +185,13 @@ def run_homplexity_analysis(file_path):
                 "sum": sum(cc_values)
             },
             "homplexity_loc" : sum(loc_values),
-            "homplexity_output" : output_text
+            "branching_depth": max(depth_values, default=0),
+            "declarations": records
         }
+        raw = output_text
     else:
-        return {"cyclomatic_complexity": {"min":0,"max":0,"average":0,"sum":0}, "homplexity_loc" : 0, "homplexity_output": "error"}
+        homplexity_data = {"cyclomatic_complexity": {"min":0,"max":0,"average":0,"sum":0}, "homplexity_loc" : 0, "branching_depth": 0, "declarations": []}
+        raw = "error"
+    if HOMPLEXITY_KEEP_OUTPUT:
+        homplexity_data["homplexity_output"] = raw
+    return homplexity_data
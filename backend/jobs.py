@@ -0,0 +1,123 @@
+# jobs.py
+import logging
+import os
+import threading
+import time
+import traceback
+import uuid
+from urllib.parse import urlencode
+from concurrent.futures import ThreadPoolExecutor
+
+# Number of pipelines that may run at the same time; further jobs wait in the queue.
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", 2))
+# Finished jobs kept for polling before the oldest are forgotten.
+MAX_FINISHED_JOBS = int(os.getenv("MAX_FINISHED_JOBS", 100))
+
+class JobQueue:
+    """
+    Runs pipeline functions on a bounded worker pool, off the event loop.
+    Each job is a plain dict that the pipeline updates as it moves through its stages,
+    plus an append-only list of events (stage changes, per-file results) for streaming.
+    """
+    def __init__(self, workers):
+        self.pool = ThreadPoolExecutor(max_workers=workers)
+        self.jobs = {}
+        self.events = {}
+        self.lock = threading.Condition()
+
+    def submit(self, fn, *args, **kwargs):
+        """Queues fn(job_id, *args, **kwargs) and returns the new job id; fn returns the report location."""
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self.lock:
+            self.jobs[job_id] = {
+                "job_id": job_id,
+                "status": "queued",
+                "stage": "queued",
+                "progress": {"files_done": 0, "files_total": 0},
+                "report_path": None,
+                "error": None,
+                "created_at": now,
+                "updated_at": now
+            }
+            self.events[job_id] = []
+            self._prune()
+        self.pool.submit(self._run, job_id, fn, args, kwargs)
+        return job_id
+
+    def _run(self, job_id, fn, args, kwargs):
+        self.update(job_id, status="running")
+        try:
+            report_path = fn(job_id, *args, **kwargs)
+            self.publish(job_id, {"event": "completed", "report_path": report_path})
+            self.update(job_id, status="completed", stage="done", report_path=report_path)
+        except Exception as e:
+            logging.error("Job %s failed:\n%s", job_id, traceback.format_exc())
+            self.publish(job_id, {"event": "failed", "error": str(e)})
+            self.update(job_id, status="failed", error=str(e))
+
+    def update(self, job_id, **fields):
+        with self.lock:
+            self.jobs[job_id].update(fields, updated_at=time.time())
+            self.lock.notify_all()
+
+    def publish(self, job_id, event):
+        with self.lock:
+            self.events[job_id].append(event)
+            self.lock.notify_all()
+
+    def publish_file(self, job_id, variant, strategy, summary):
+        """Publishes a file's headline metrics; the full entry is served by /files/{file_id}."""
+        query = {"run_id": job_id, "variant": variant}
+        if strategy:
+            query["strategy"] = strategy
+        self.publish(job_id, {
+            "event": "file", "variant": variant, "strategy": strategy, "file": summary,
+            "detail_url": f"/files/{summary['file_id']}?{urlencode(query)}"
+        })
+
+    def stream(self, job_id, timeout=15):
+        """
+        Yields the job's events from the first one, blocking for new events until
+        the job has finished. Yields None after `timeout` seconds without an event
+        so callers can send keep-alives.
+        """
+        index = 0
+        while True:
+            with self.lock:
+                if index >= len(self.events.get(job_id, [])) and not self._finished(job_id):
+                    self.lock.wait(timeout)
+                events = self.events.get(job_id, [])[index:]
+                finished = self._finished(job_id)
+            index += len(events)
+            for event in events:
+                yield event
+            if finished and not events:
+                return
+            if not events:
+                yield None
+
+    def _finished(self, job_id):
+        job = self.jobs.get(job_id)
+        return job is None or job["status"] in ("completed", "failed")
+
+    def set_stage(self, job_id, stage, files_total=0):
+        self.publish(job_id, {"event": "stage", "stage": stage})
+        self.update(job_id, stage=stage, progress={"files_done": 0, "files_total": files_total})
+
+    def set_progress(self, job_id, files_done, files_total):
+        self.update(job_id, progress={"files_done": files_done, "files_total": files_total})
+
+    def get(self, job_id):
+        with self.lock:
+            job = self.jobs.get(job_id)
+            return dict(job) if job else None
+
+    def _prune(self):
+        finished = [job for job in self.jobs.values() if job["status"] in ("completed", "failed")]
+        finished.sort(key=lambda job: job["updated_at"])
+        for job in finished[:max(0, len(finished) - MAX_FINISHED_JOBS)]:
+            del self.jobs[job["job_id"]]
+            del self.events[job["job_id"]]
+
+job_queue = JobQueue(INGEST_WORKERS)
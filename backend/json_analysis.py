@@ -1,18 +1,22 @@
 import streamlit as st
+import gzip
 import json
 import re
 import pandas as pd
 
 st.title("Refactor Analysis Metrics with Improvement %")
 
-# File uploader
-uploaded_file = st.file_uploader("Upload analysis JSON", type="json")
+# File uploader: the report as written by the server (project_result.json.gz) or plain JSON
+uploaded_file = st.file_uploader("Upload analysis JSON", type=["json", "gz"])
 if not uploaded_file:
     st.info("Please upload a JSON file to begin.")
     st.stop()
 
 # Load JSON
-data = json.load(uploaded_file)
+if uploaded_file.name.endswith(".gz"):
+    data = json.loads(gzip.decompress(uploaded_file.getvalue()))
+else:
+    data = json.load(uploaded_file)
 
 def extract_entries(data, key_path):
     entry = data
@@ -27,7 +31,11 @@ def get_file_cc(f):
     return cc
 
 def get_file_depth(f):
-    raw = f.get("homplexity_analysis", {}).get("homplexity_output", "")
+    homplexity = f.get("homplexity_analysis", {})
+    if "branching_depth" in homplexity:
+        return homplexity["branching_depth"]
+    # Reports written before the per-declaration records only carry the raw output
+    raw = homplexity.get("homplexity_output", "")
     if isinstance(raw, dict):
         raw = raw.get("output_text", "")
     if "\\n" in raw and "\n" not in raw:
@@ -1,4 +1,5 @@
 #!/usr/bin/env python3
+import gzip
 import json
 import re
 import argparse
@@ -19,12 +20,16 @@ def get_file_cc(file_entry):
 
 def get_file_depth(file_entry):
     """
-    Extract *all* 'branching depth of X' occurrences from homplexity_output
-    and return the maximum X. Handles:
+    Return the deepest branching depth of the file. Uses the parsed
+    'branching_depth' field when present; older reports only carry the raw
+    homplexity_output, so for those extract *all* 'branching depth of X'
+    occurrences and return the maximum X. Handles:
      - file_entry['homplexity_output'] as a raw string (with real newlines or '\\n')
      - or as a dict with 'output_text'.
     """
     homplexity_analysis = file_entry.get('homplexity_analysis', {})
+    if 'branching_depth' in homplexity_analysis:
+        return homplexity_analysis['branching_depth']
     raw = homplexity_analysis.get('homplexity_output', '')
     
     if isinstance(raw, dict):
@@ -64,10 +69,11 @@ def main():
     parser = argparse.ArgumentParser(
         description="Compare LOC, CC, and Branching Depth per file (pre/post), showing totals."
     )
-    parser.add_argument("json_path", help="Path to the JSON analysis file")
+    parser.add_argument("json_path", help="Path to the JSON analysis file (plain, or gzip-compressed as the server writes it)")
     args = parser.parse_args()
 
-    with open(args.json_path, 'r', encoding='utf-8') as f:
+    opener = gzip.open if args.json_path.endswith('.gz') else open
+    with opener(args.json_path, 'rt', encoding='utf-8') as f:
         data = json.load(f)
 
     pre_files  = extract_entries(data, ['analysis', 'pre_refactor', 'files'])
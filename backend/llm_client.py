@@ -0,0 +1,173 @@
+# llm_client.py
+import atexit
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from tool_cache import ResultCache
+
+# Which backend answers chat requests: "openrouter" (live API), "record" (live API,
+# every response saved to LLM_RECORD_DIR), "replay" (saved responses only) or
+# "synthetic" (canned empty answers). replay and synthetic never touch the network.
+LLM_PROVIDER = os.getenv("LLM_PROVIDER", "openrouter")
+LLM_RECORD_DIR = os.getenv("LLM_RECORD_DIR", "/tmp/llm_recordings")
+# Simulated per-request latency in seconds for replay and synthetic providers.
+LLM_REPLAY_LATENCY = float(os.getenv("LLM_REPLAY_LATENCY", 0))
+OPENROUTER_API_URL = os.getenv("OPENROUTER_API_URL", "https://openrouter.ai/api/v1/chat/completions")
+# Requests in flight at once, and the token bucket that paces how fast new ones start.
+LLM_CONCURRENCY = int(os.getenv("LLM_CONCURRENCY", 8))
+LLM_RATE_PER_SECOND = float(os.getenv("LLM_RATE_PER_SECOND", 2))
+LLM_RATE_BURST = int(os.getenv("LLM_RATE_BURST", 4))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", 4))
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", 180))
+LLM_BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", 1))
+LLM_BACKOFF_MAX = float(os.getenv("LLM_BACKOFF_MAX", 60))
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+# Completed responses are reused for identical (model, system prompt, user content) requests.
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", "/tmp/llm_cache.sqlite")
+LLM_CACHE_MAX_BYTES = int(os.getenv("LLM_CACHE_MAX_BYTES", 256 * 1024 * 1024))
+LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", 30 * 24 * 3600))
+# The cache is neither read nor written when bypassed; offline providers always bypass it.
+LLM_CACHE_BYPASS = os.getenv("LLM_CACHE_BYPASS", "0") == "1" or LLM_PROVIDER != "openrouter"
+
+class TokenBucket:
+    """Allows `rate` acquisitions per second with bursts of up to `burst`; pause() holds everyone back."""
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.not_before = 0
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if now >= self.not_before and self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = max(self.not_before - now, (1 - self.tokens) / self.rate)
+            time.sleep(wait)
+
+    def pause(self, seconds):
+        with self.lock:
+            self.not_before = max(self.not_before, time.monotonic() + seconds)
+
+class LLMClient:
+    """
+    Chat-completions client shared by all pipeline threads: one pooled HTTP session,
+    at most `concurrency` requests in flight, token-bucket pacing, per-call timeouts
+    and jittered exponential backoff on 429/5xx and connection errors.
+    """
+    def __init__(self, api_url, concurrency, rate, burst, max_retries, timeout):
+        self.api_url = api_url
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=concurrency)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.semaphore = threading.BoundedSemaphore(concurrency)
+        self.bucket = TokenBucket(rate, burst)
+
+    def chat(self, model, messages, api_key):
+        """Posts one chat completion and returns the decoded JSON response."""
+        payload = {"model": model, "messages": messages}
+        headers = {
+            "Authorization": f"Bearer {api_key}",
+            "Content-Type": "application/json"
+        }
+        for attempt in range(self.max_retries + 1):
+            self.bucket.acquire()
+            with self.semaphore:
+                try:
+                    response = self.session.post(self.api_url, headers=headers, json=payload, timeout=self.timeout)
+                except (requests.ConnectionError, requests.Timeout):
+                    if attempt == self.max_retries:
+                        raise
+                    response = None
+            if response is not None and (response.status_code not in RETRY_STATUSES or attempt == self.max_retries):
+                response.raise_for_status()
+                return response.json()
+
+            delay = random.uniform(0, min(LLM_BACKOFF_MAX, LLM_BACKOFF_BASE * 2 ** attempt))
+            if response is not None and response.status_code == 429:
+                retry_after = response.headers.get("Retry-After", "")
+                if retry_after.isdigit():
+                    delay = int(retry_after) + random.uniform(0, LLM_BACKOFF_BASE)
+                # Rate limits apply to the whole API key, so hold back every caller
+                self.bucket.pause(delay)
+            time.sleep(delay)
+
+def request_digest(model, messages):
+    return hashlib.sha256(json.dumps({"model": model, "messages": messages}, sort_keys=True).encode()).hexdigest()
+
+class RecordingProvider:
+    """Forwards to another provider and saves each response under record_dir/<request digest>.json."""
+    def __init__(self, provider, record_dir):
+        self.provider = provider
+        self.record_dir = record_dir
+        os.makedirs(record_dir, exist_ok=True)
+
+    def chat(self, model, messages, api_key):
+        response = self.provider.chat(model, messages, api_key)
+        path = os.path.join(self.record_dir, request_digest(model, messages) + ".json")
+        with open(path + ".tmp", "w") as f:
+            json.dump({"model": model, "messages": messages, "response": response}, f)
+        os.replace(path + ".tmp", path)
+        return response
+
+class ReplayProvider:
+    """Serves responses saved by RecordingProvider after `latency` seconds; unknown requests raise LookupError."""
+    def __init__(self, record_dir, latency):
+        self.record_dir = record_dir
+        self.latency = latency
+
+    def chat(self, model, messages, api_key):
+        path = os.path.join(self.record_dir, request_digest(model, messages) + ".json")
+        if not os.path.exists(path):
+            raise LookupError(f"No recorded LLM response for this request in {self.record_dir}")
+        time.sleep(self.latency)
+        with open(path) as f:
+            return json.load(f)["response"]
+
+class SyntheticProvider:
+    """Answers every request after `latency` seconds with a well-formed response that proposes no changes."""
+    def __init__(self, latency):
+        self.latency = latency
+
+    def chat(self, model, messages, api_key):
+        time.sleep(self.latency)
+        content = json.dumps({"final_candidates": []})
+        return {"model": model, "choices": [{"message": {"role": "assistant", "content": content}}]}
+
+def make_llm_provider(name):
+    if name in ("openrouter", "record"):
+        client = LLMClient(OPENROUTER_API_URL, LLM_CONCURRENCY, LLM_RATE_PER_SECOND, LLM_RATE_BURST, LLM_MAX_RETRIES, LLM_TIMEOUT)
+        return client if name == "openrouter" else RecordingProvider(client, LLM_RECORD_DIR)
+    if name == "replay":
+        return ReplayProvider(LLM_RECORD_DIR, LLM_REPLAY_LATENCY)
+    if name == "synthetic":
+        return SyntheticProvider(LLM_REPLAY_LATENCY)
+    raise ValueError(f"Unknown LLM_PROVIDER: {name}")
+
+def llm_cache_key(model, system_prompt, user_content):
+    parts = [
+        model,
+        hashlib.sha256(system_prompt.encode()).hexdigest(),
+        hashlib.sha256(user_content.encode()).hexdigest()
+    ]
+    return hashlib.sha256("\0".join(parts).encode()).hexdigest()
+
+llm_cache = ResultCache(LLM_CACHE_PATH, LLM_CACHE_MAX_BYTES, ttl=LLM_CACHE_TTL)
+atexit.register(llm_cache.flush)
+llm_client = make_llm_provider(LLM_PROVIDER)
@@ -2,74 +2,135 @@
 import zipfile
 import os
 import glob
+import re
+import hashlib
+import shutil
 import subprocess
+import threading
+
+# Archive members worth extracting: Haskell sources and the build files GHC/cabal/stack read.
+PROJECT_FILE_SUFFIXES = (".hs", ".lhs", ".hs-boot", ".lhs-boot", ".cabal")
+PROJECT_FILE_NAMES = ("stack.yaml", "cabal.project", "package.yaml", "hie.yaml")
+VARIANT_DIRS = ("static_refactored", "llm_only_refactored", "hybrid_refactored")
+
+# Bare mirrors of ingested repositories, fetched incrementally on every later ingestion.
+GIT_MIRROR_DIR = os.getenv("GIT_MIRROR_DIR", "/tmp/git_mirrors")
+# Check out only Haskell sources and build files of a repository.
+GIT_SPARSE_CHECKOUT = os.getenv("GIT_SPARSE_CHECKOUT", "1") != "0"
+mirror_locks = {}
+mirror_locks_guard = threading.Lock()
+
+MODULE_HEADER = re.compile(r"^>?[ \t]*module[ \t]+([A-Z][\w.']*)", re.MULTILINE)
+IMPORT_LINE = re.compile(
+    r"^>?[ \t]*import[ \t]+(?:\{-#[ \t]*SOURCE[ \t]*#-\}[ \t]+)?(?:safe[ \t]+)?(?:qualified[ \t]+)?"
+    r"(?:\"[^\"]*\"[ \t]+)?([A-Z][\w.']*)",
+    re.MULTILINE
+)
 
 def ingest_project(uploaded_zip=None, repo_url=None, branch="main"):
+    """uploaded_zip is the path (or a file object) of the uploaded archive."""
     project_dir = None
     if uploaded_zip:
-        # project_dir = "/tmp/projects"
-        # os.makedirs(project_dir, exist_ok=True)
-        base_dir = "/tmp/project"
-        counter = 1
-        project_dir = base_dir
-
-        while os.path.exists(project_dir):
-            project_dir = f"{base_dir}_{counter}"
-            counter += 1
-        
+        project_dir = claim_directory("/tmp/project")
         pre_refactored_dir = f"{project_dir}/pre_refactor"
-        static_refactored_dir = f"{project_dir}/static_refactored"
-        llm_only_refactored_dir = f"{project_dir}/llm_only_refactored"
-        hybrid_refactored_dir = f"{project_dir}/hybrid_refactored"
-
         os.makedirs(pre_refactored_dir)
-        os.makedirs(static_refactored_dir)
-        os.makedirs(llm_only_refactored_dir)
-        os.makedirs(hybrid_refactored_dir)
-
-        zip_path = f"{pre_refactored_dir}/upload.zip"
-        with open(zip_path, "wb") as f:
-            f.write(uploaded_zip.getbuffer())
-        with zipfile.ZipFile(zip_path, 'r') as z:
-            z.extractall(pre_refactored_dir)
-        
-        zip_path_static_refactored = f"{static_refactored_dir}/upload.zip"
-        with open(zip_path_static_refactored, "wb") as f:
-            f.write(uploaded_zip.getbuffer())
-        with zipfile.ZipFile(zip_path_static_refactored, 'r') as z:
-            z.extractall(static_refactored_dir)
-        
-        zip_path_llm_only_refactored = f"{llm_only_refactored_dir}/upload.zip"
-        with open(zip_path_llm_only_refactored, "wb") as f:
-            f.write(uploaded_zip.getbuffer())
-        with zipfile.ZipFile(zip_path_llm_only_refactored, 'r') as z:
-            z.extractall(llm_only_refactored_dir)
-        
-        zip_path_hybrid_refactored = f"{hybrid_refactored_dir}/upload.zip"
-        with open(zip_path_hybrid_refactored, "wb") as f:
-            f.write(uploaded_zip.getbuffer())
-        with zipfile.ZipFile(zip_path_hybrid_refactored, 'r') as z:
-            z.extractall(hybrid_refactored_dir)
+        extract_project_files(uploaded_zip, pre_refactored_dir)
+        for variant_dir in VARIANT_DIRS:
+            materialize_variant_tree(pre_refactored_dir, f"{project_dir}/{variant_dir}")
 
         return get_haskell_files(pre_refactored_dir)
-        # return get_haskell_files(project_dir, static_refactored_dir, llm_only_refactored_dir, hybrid_refactored_dir)
     elif repo_url:
-        # project_dir = "/tmp/repo"
-        base_dir = "/tmp/repo"
-        counter = 1
-        project_dir = base_dir
+        mirror_dir = update_mirror(repo_url)
+        if mirror_dir is None:
+            return [], None
+        project_dir = claim_directory("/tmp/repo")
+        pre_refactored_dir = f"{project_dir}/pre_refactor"
+        if not checkout_worktree(mirror_dir, branch, pre_refactored_dir):
+            shutil.rmtree(project_dir, ignore_errors=True)
+            return [], None
+        for variant_dir in VARIANT_DIRS:
+            materialize_variant_tree(pre_refactored_dir, f"{project_dir}/{variant_dir}")
+        return get_haskell_files(pre_refactored_dir)
+    return [], None
 
-        while os.path.exists(project_dir):
+def claim_directory(base_dir):
+    """Creates and returns the first free directory of base_dir, base_dir_1, base_dir_2, ..."""
+    project_dir = base_dir
+    counter = 1
+    while True:
+        try:
+            os.mkdir(project_dir)
+            return project_dir
+        except FileExistsError:
             project_dir = f"{base_dir}_{counter}"
             counter += 1
-        clone_cmd = ["git", "clone", "--depth", "1", repo_url, project_dir]
-        if branch:
-            clone_cmd[2:2] = ["-b", branch]
-        result = subprocess.run(clone_cmd, capture_output=True, text=True)
+
+def update_mirror(repo_url):
+    """
+    Returns the path of the bare mirror of repo_url, cloning it on first use and
+    fetching only new objects afterwards, or None if git fails.
+    """
+    mirror_dir = os.path.join(GIT_MIRROR_DIR, hashlib.sha256(repo_url.encode()).hexdigest()[:16] + ".git")
+    with mirror_locks_guard:
+        lock = mirror_locks.setdefault(mirror_dir, threading.Lock())
+    with lock:
+        if os.path.isdir(mirror_dir):
+            # If the remote is unreachable, keep serving the mirror as last fetched
+            subprocess.run(["git", "-C", mirror_dir, "fetch", "--prune", "--quiet"], capture_output=True, text=True)
+            return mirror_dir
+        os.makedirs(GIT_MIRROR_DIR, exist_ok=True)
+        result = subprocess.run(["git", "clone", "--mirror", "--quiet", repo_url, mirror_dir], capture_output=True, text=True)
         if result.returncode != 0:
-            return [], None
-        return get_haskell_files(project_dir)
-    return [], None
+            shutil.rmtree(mirror_dir, ignore_errors=True)
+            return None
+    return mirror_dir
+
+def checkout_worktree(mirror_dir, branch, target_dir):
+    """
+    Checks branch of a mirror out into target_dir. The clone shares the mirror's
+    object store, and with GIT_SPARSE_CHECKOUT only project files are written.
+    """
+    clone_cmd = ["git", "clone", "--shared", "--no-checkout", "--quiet", mirror_dir, target_dir]
+    if branch:
+        clone_cmd[2:2] = ["-b", branch]
+    commands = [clone_cmd]
+    if GIT_SPARSE_CHECKOUT:
+        patterns = [f"*{suffix}" for suffix in PROJECT_FILE_SUFFIXES] + list(PROJECT_FILE_NAMES)
+        commands.append(["git", "-C", target_dir, "sparse-checkout", "set", "--no-cone"] + patterns)
+    commands.append(["git", "-C", target_dir, "reset", "--hard", "--quiet"])
+    for cmd in commands:
+        result = subprocess.run(cmd, capture_output=True, text=True)
+        if result.returncode != 0:
+            return False
+    return True
+
+def is_project_file(name):
+    base_name = os.path.basename(name)
+    return base_name.endswith(PROJECT_FILE_SUFFIXES) or base_name in PROJECT_FILE_NAMES
+
+def extract_project_files(zip_source, target_dir):
+    """Extracts only the Haskell sources and build files of a zip (path or file object) into target_dir."""
+    with zipfile.ZipFile(zip_source, "r") as z:
+        for member in z.infolist():
+            if not member.is_dir() and is_project_file(member.filename):
+                z.extract(member, target_dir)
+
+def materialize_variant_tree(source_dir, target_dir):
+    """
+    Mirrors source_dir into target_dir with hardlinks, falling back to copies across
+    filesystems. Writers must replace a variant file (os.remove, then write) rather
+    than modify it in place, so the pre_refactor original is never touched.
+    """
+    for root, dirs, files in os.walk(source_dir):
+        # Checkouts of a repo_url keep their git metadata in pre_refactor only
+        dirs[:] = [d for d in dirs if d != ".git"]
+        target_root = os.path.join(target_dir, os.path.relpath(root, source_dir))
+        os.makedirs(target_root, exist_ok=True)
+        for name in files:
+            try:
+                os.link(os.path.join(root, name), os.path.join(target_root, name))
+            except OSError:
+                shutil.copy2(os.path.join(root, name), os.path.join(target_root, name))
 
 def get_haskell_files(project_dir):
     hs_files = glob.glob(f"{project_dir}/**/*.hs", recursive=True)
@@ -78,6 +139,80 @@ def get_haskell_files(project_dir):
 
     return source_files, project_dir
 
+def parse_module_name(code):
+    """Returns the name from the `module` header of a .hs/.lhs source, or Main if it has none."""
+    match = MODULE_HEADER.search(code)
+    return match.group(1) if match else "Main"
+
+def parse_imports(code):
+    """Returns the module names imported by a .hs/.lhs source, in order of appearance."""
+    return IMPORT_LINE.findall(code)
+
+def build_import_graph(source_files):
+    """
+    Parses the module/import headers of source_files into a graph between the files.
+    Returns {"modules": {file: module name}, "imports": {file: [files it imports]},
+    "importers": {file: [files importing it]}}; imports of non-local modules are dropped.
+    """
+    modules = {}
+    module_imports = {}
+    for file in source_files:
+        with open(file, "r") as f:
+            code = f.read()
+        modules[file] = parse_module_name(code)
+        module_imports[file] = parse_imports(code)
+
+    files_by_module = {}
+    for file, module_name in modules.items():
+        files_by_module.setdefault(module_name, []).append(file)
+
+    imports = {file: [] for file in source_files}
+    importers = {file: [] for file in source_files}
+    for file in source_files:
+        for module_name in module_imports[file]:
+            for dependency in files_by_module.get(module_name, []):
+                if dependency != file and dependency not in imports[file]:
+                    imports[file].append(dependency)
+                    importers[dependency].append(file)
+    return {"modules": modules, "imports": imports, "importers": importers}
+
+def transitive_closure(import_graph, files, direction):
+    seen = set(files)
+    stack = list(files)
+    while stack:
+        for neighbour in import_graph[direction].get(stack.pop(), []):
+            if neighbour not in seen:
+                seen.add(neighbour)
+                stack.append(neighbour)
+    return seen
+
+def dependencies(import_graph, file):
+    """Returns every local file that `file` imports, directly or transitively."""
+    return transitive_closure(import_graph, [file], "imports") - {file}
+
+def reverse_dependencies(import_graph, changed_files):
+    """Returns changed_files plus every file that imports one of them, directly or transitively."""
+    return transitive_closure(import_graph, changed_files, "importers")
+
+def topological_order(import_graph):
+    """
+    Orders the graph's files so that every file comes after the files it imports.
+    Ties keep source order; files on an import cycle are appended in source order.
+    """
+    files = list(import_graph["imports"])
+    pending = {file: len(import_graph["imports"][file]) for file in files}
+    ready = [file for file in files if pending[file] == 0]
+    order = []
+    while ready:
+        file = ready.pop(0)
+        order.append(file)
+        for importer in import_graph["importers"][file]:
+            pending[importer] -= 1
+            if pending[importer] == 0:
+                ready.append(importer)
+    placed = set(order)
+    return order + [file for file in files if file not in placed]
+
 
 # def get_haskell_files(project_dir, static_refactored_dir, llm_only_refactored_dir, hybrid_refactored_dir):
 #     hs_files = glob.glob(f"{project_dir}/**/*.hs", recursive=True)
@@ -1,7 +1,18 @@
 # report.py
+import gzip
+import hashlib
 import json
+import os
+
+# Fields holding source text or raw tool output, and fields holding suggestion lists;
+# compact reports keep them in the blob store and leave a {"$blob": digest} reference.
+TEXT_BLOB_FIELDS = {"original_code", "refactored_code", "homplexity_output"}
+JSON_BLOB_FIELDS = {"suggestions"}
 
 def generate_report(analysis_results, project_name="ExampleProject"):
+    return json.dumps(build_report(analysis_results, project_name), indent=2)
+
+def build_report(analysis_results, project_name="ExampleProject"):
     # report = {
     #     "project_name": project_name,
     #     "analysis": {
@@ -25,30 +36,82 @@ def generate_report(analysis_results, project_name="ExampleProject"):
     #         }
     #     }
     # }
+    # Every variant x strategy slot exists; cells that were not run stay empty
+    post_refactor = {
+        variant: {"zero_shot": {}, "one_shot": {}, "chain_of_thought": {}}
+        for variant in ("static", "llm_only", "hybrid")
+    }
+    for variant, cells in analysis_results.get("post_refactor", {}).items():
+        post_refactor.setdefault(variant, {}).update(cells)
     report = {
         "project_name": project_name,
         "analysis": {
             "pre_refactor": analysis_results["pre_refactor"],
-            "post_refactor": {
-                "static": {
-                    "zero_shot": {},
-                    "one_shot": analysis_results["post_refactor"]["static"]["one_shot"],
-                    "chain_of_thought": {}
-                },
-                "llm_only": {
-                    "zero_shot": {},
-                    "one_shot": {},
-                    "chain_of_thought": {}
-                },
-                "hybrid": {
-                    "zero_shot": {},
-                    "one_shot": analysis_results["post_refactor"]["hybrid"]["one_shot"],
-                    "chain_of_thought": {}
-                }
-            }
+            "post_refactor": post_refactor
         }
     }
-    return json.dumps(report, indent=2)
+    return report
+
+def compact_report(report, store):
+    """
+    Returns a copy of report with every code, raw-output and suggestion field
+    replaced by a reference to its blob in store. Identical text (e.g. a file's
+    original code repeated in every variant) is stored once.
+    """
+    if isinstance(report, list):
+        return [compact_report(item, store) for item in report]
+    if not isinstance(report, dict):
+        return report
+    compact = {}
+    for key, value in report.items():
+        if key in TEXT_BLOB_FIELDS and isinstance(value, str):
+            compact[key] = {"$blob": store.put(value)}
+        elif key in JSON_BLOB_FIELDS and isinstance(value, list):
+            compact[key] = {"$blob": store.put(json.dumps(value)), "format": "json"}
+        else:
+            compact[key] = compact_report(value, store)
+    return compact
+
+def expand_blobs(report, store):
+    """Inverse of compact_report: replaces every blob reference with the blob's content."""
+    if isinstance(report, list):
+        return [expand_blobs(item, store) for item in report]
+    if not isinstance(report, dict):
+        return report
+    if "$blob" in report:
+        text = store.get(report["$blob"])
+        return json.loads(text) if report.get("format") == "json" else text
+    return {key: expand_blobs(value, store) for key, value in report.items()}
+
+def write_compressed_report(report, path):
+    """Writes report as compact, gzip-compressed JSON, replacing path atomically."""
+    tmp_path = path + ".tmp"
+    with gzip.open(tmp_path, "wt", encoding="utf-8") as f:
+        json.dump(report, f, separators=(",", ":"))
+    os.replace(tmp_path, path)
+
+def read_compressed_report(path):
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        return json.load(f)
+
+def report_file_id(file_name):
+    """Stable id for a source file, shared by its entries in every variant of a report."""
+    return hashlib.sha256(file_name.encode()).hexdigest()[:16]
+
+def file_summary(file_metrics):
+    """The headline metrics of a file entry, without code, suggestions or tool output."""
+    cc = file_metrics.get("cyclomatic_complexity", {})
+    return {
+        "file_id": report_file_id(file_metrics["file_name"]),
+        "file_name": file_metrics["file_name"],
+        "cyclomatic_complexity": cc.get("sum", 0),
+        "max_cyclomatic_complexity": cc.get("max", 0),
+        "lines_of_code": file_metrics.get("lines_of_code", 0),
+        "homplexity_lines_of_code": file_metrics.get("homplexity_lines_of_code", 0),
+        "syntax_errors": file_metrics.get("syntax_errors", 0),
+        "hlint_suggestions": file_metrics.get("hlint_suggestions", {}).get("total", 0),
+        "code_quality_score": file_metrics.get("code_quality_score", 0)
+    }
 
 def generate_post_overall(file_list):
     total_loc = sum(f["post_analysis"]["lines_of_code"] for f in file_list if "post_analysis" in f)
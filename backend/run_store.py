@@ -0,0 +1,172 @@
+# run_store.py
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from blob_store import blob_store
+from report import compact_report, file_summary
+
+RUN_STORE_PATH = os.getenv("RUN_STORE_PATH", "project_result/runs.sqlite")
+
+# Metrics that /runs/{run_id}/top can rank files by, and the column holding each
+TOP_METRICS = {
+    "cyclomatic_complexity": "cc_sum",
+    "max_cyclomatic_complexity": "cc_max",
+    "lines_of_code": "lines_of_code",
+    "homplexity_lines_of_code": "homplexity_loc",
+    "syntax_errors": "syntax_errors",
+    "hlint_suggestions": "hlint_total",
+    "code_quality_score": "code_quality_score",
+}
+
+class RunStore:
+    """
+    SQLite store of pipeline runs. Every run keeps one row per (variant, strategy, file)
+    with the headline metrics in indexed columns and the full compact entry (code and
+    suggestions as blob references) as JSON, written as soon as the file is evaluated.
+    Pre-refactor rows are stored with an empty strategy.
+    """
+    def __init__(self, path, blob_store):
+        self.blob_store = blob_store
+        self.lock = threading.Lock()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS runs (
+                run_id TEXT PRIMARY KEY, project_name TEXT, status TEXT,
+                created REAL, updated REAL, report_path TEXT
+            );
+            CREATE TABLE IF NOT EXISTS run_files (
+                run_id TEXT, variant TEXT, strategy TEXT, file_id TEXT, position INTEGER,
+                file_name TEXT, cc_sum REAL, cc_max REAL, lines_of_code INTEGER, homplexity_loc INTEGER,
+                syntax_errors INTEGER, hlint_total INTEGER, code_quality_score REAL, entry TEXT,
+                PRIMARY KEY (run_id, variant, strategy, file_id)
+            );
+            CREATE INDEX IF NOT EXISTS run_files_position ON run_files (run_id, variant, strategy, position);
+            CREATE INDEX IF NOT EXISTS run_files_cc ON run_files (run_id, variant, strategy, cc_sum);
+            CREATE INDEX IF NOT EXISTS run_files_file ON run_files (file_id);
+            CREATE INDEX IF NOT EXISTS runs_created ON runs (status, created);
+        """)
+        self.conn.commit()
+
+    def create_run(self, run_id, project_name):
+        now = time.time()
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO runs (run_id, project_name, status, created, updated, report_path) VALUES (?, ?, 'running', ?, ?, NULL)",
+                (run_id, project_name, now, now)
+            )
+            self.conn.commit()
+
+    def finish_run(self, run_id, status, report_path=None):
+        with self.lock:
+            self.conn.execute(
+                "UPDATE runs SET status = ?, report_path = ?, updated = ? WHERE run_id = ?",
+                (status, report_path, time.time(), run_id)
+            )
+            self.conn.commit()
+
+    def record_file(self, run_id, variant, strategy, file_metrics, position=None):
+        """
+        Stores one evaluated file of a run at `position` in its variant's listing (by
+        default after the files already recorded for it); a file stored again is updated
+        in place and keeps its position.
+        """
+        strategy = strategy or ""
+        entry = compact_report(file_metrics, self.blob_store)
+        summary = file_summary(file_metrics)
+        row = (
+            run_id, variant, strategy, summary["file_id"], summary["file_name"],
+            *(summary[metric] for metric in TOP_METRICS),
+            json.dumps(entry, separators=(",", ":"))
+        )
+        with self.lock:
+            # A file recorded again keeps its original position
+            self.conn.execute(
+                "INSERT INTO run_files (run_id, variant, strategy, file_id, file_name, cc_sum, cc_max, lines_of_code,"
+                " homplexity_loc, syntax_errors, hlint_total, code_quality_score, entry, position)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?,"
+                " COALESCE(?, (SELECT COALESCE(MAX(position) + 1, 0) FROM run_files WHERE run_id = ? AND variant = ? AND strategy = ?)))"
+                " ON CONFLICT (run_id, variant, strategy, file_id) DO UPDATE SET"
+                " file_name = excluded.file_name, cc_sum = excluded.cc_sum, cc_max = excluded.cc_max,"
+                " lines_of_code = excluded.lines_of_code, homplexity_loc = excluded.homplexity_loc,"
+                " syntax_errors = excluded.syntax_errors, hlint_total = excluded.hlint_total,"
+                " code_quality_score = excluded.code_quality_score, entry = excluded.entry",
+                row + (position, run_id, variant, strategy)
+            )
+            self.conn.execute("UPDATE runs SET updated = ? WHERE run_id = ?", (time.time(), run_id))
+            self.conn.commit()
+
+    def get_run(self, run_id):
+        """The run's row plus its file count per variant and strategy, or None."""
+        with self.lock:
+            run = self.conn.execute("SELECT * FROM runs WHERE run_id = ?", (run_id,)).fetchone()
+            if run is None:
+                return None
+            counts = self.conn.execute(
+                "SELECT variant, strategy, COUNT(*) FROM run_files WHERE run_id = ? GROUP BY variant, strategy", (run_id,)
+            ).fetchall()
+        run = dict(run)
+        run["files"] = [{"variant": variant, "strategy": strategy or None, "count": count} for variant, strategy, count in counts]
+        return run
+
+    def list_runs(self, limit=50):
+        with self.lock:
+            rows = self.conn.execute("SELECT * FROM runs ORDER BY created DESC LIMIT ?", (limit,)).fetchall()
+        return [dict(row) for row in rows]
+
+    def latest_run_id(self):
+        """The most recently started completed run, or None."""
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT run_id FROM runs WHERE status = 'completed' ORDER BY created DESC LIMIT 1"
+            ).fetchone()
+        return row[0] if row else None
+
+    def list_files(self, run_id, variant, strategy, cursor=0, limit=50):
+        """
+        Returns (total, entries, next_cursor) for the first `limit` files at positions
+        from cursor on; next_cursor is the position the following page starts at, or
+        None after the last file. Positions may have gaps (a cell need not have every file).
+        """
+        strategy = "" if variant == "pre_refactor" else strategy
+        with self.lock:
+            total = self.conn.execute(
+                "SELECT COUNT(*) FROM run_files WHERE run_id = ? AND variant = ? AND strategy = ?", (run_id, variant, strategy)
+            ).fetchone()[0]
+            rows = self.conn.execute(
+                "SELECT position, entry FROM run_files WHERE run_id = ? AND variant = ? AND strategy = ? AND position >= ?"
+                " ORDER BY position LIMIT ?",
+                (run_id, variant, strategy, cursor, limit + 1)
+            ).fetchall()
+        next_cursor = rows[limit]["position"] if len(rows) > limit else None
+        return total, [json.loads(row["entry"]) for row in rows[:limit]], next_cursor
+
+    def get_file(self, run_id, variant, strategy, file_id):
+        strategy = "" if variant == "pre_refactor" else strategy
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT entry FROM run_files WHERE run_id = ? AND variant = ? AND strategy = ? AND file_id = ?",
+                (run_id, variant, strategy, file_id)
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def top_files(self, run_id, variant, strategy, metric, n=10, ascending=False):
+        """The n files of a run variant ranked by one of TOP_METRICS, as lightweight summaries."""
+        strategy = "" if variant == "pre_refactor" else strategy
+        column = TOP_METRICS[metric]
+        with self.lock:
+            rows = self.conn.execute(
+                f"SELECT file_id, file_name, {column} AS value FROM run_files"
+                f" WHERE run_id = ? AND variant = ? AND strategy = ? ORDER BY {column} {'ASC' if ascending else 'DESC'}, position LIMIT ?",
+                (run_id, variant, strategy, n)
+            ).fetchall()
+        return [{"file_id": row["file_id"], "file_name": row["file_name"], metric: row["value"]} for row in rows]
+
+run_store = RunStore(RUN_STORE_PATH, blob_store)
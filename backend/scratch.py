@@ -0,0 +1,39 @@
+# scratch.py
+import os
+import shutil
+import tempfile
+
+def default_scratch_root():
+    """/dev/shm when it is a writable directory (tmpfs on Linux), the system temp directory otherwise."""
+    if os.path.isdir("/dev/shm") and os.access("/dev/shm", os.W_OK):
+        return "/dev/shm"
+    return tempfile.gettempdir()
+
+SCRATCH_ROOT = os.getenv("SCRATCH_ROOT") or default_scratch_root()
+
+class ScratchWorkspace:
+    """
+    A private directory under SCRATCH_ROOT for the temporary files of one run.
+    Every write() lands in its own subdirectory, so any number of threads and
+    concurrent runs can use their workspaces at once. Use as a context manager;
+    the whole tree is removed on exit.
+    """
+    def __init__(self, prefix="run_", root=None):
+        self.root = root or SCRATCH_ROOT
+        self.prefix = prefix
+        self.path = None
+
+    def __enter__(self):
+        self.path = tempfile.mkdtemp(prefix=self.prefix, dir=self.root)
+        return self
+
+    def __exit__(self, *exc_info):
+        shutil.rmtree(self.path, ignore_errors=True)
+
+    def write(self, code, file_name="temp_code.hs"):
+        """Writes code to a fresh path ending in file_name's base name and returns that path."""
+        target_dir = tempfile.mkdtemp(dir=self.path)
+        path = os.path.join(target_dir, os.path.basename(file_name))
+        with open(path, "w") as f:
+            f.write(code)
+        return path
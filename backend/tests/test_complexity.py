@@ -0,0 +1,117 @@
+import homplexity_analysis
+from complexity import blank_comments_and_strings, function_metrics, homplexity_report, signature_arguments
+from homplexity_analysis import native_homplexity_analysis, parse_homplexity_output
+
+# Expected figures follow homplexity's counting: CC = 1 + (clauses - 1) + decision points,
+# LOC counts the non-blank lines of a function without its signature.
+DEMO = """\
+module Demo where
+
+-- | Sign of a number
+sign :: Int -> Int
+sign n
+  | n > 0 = 1
+  | n < 0 = -1
+  | otherwise = 0
+
+describe :: Maybe Int -> Bool -> String
+describe m verbose = case m of
+  Just n -> if verbose then "number " ++ show n else "number"
+  Nothing -> "none"
+
+len :: [a] -> Int
+len [] = 0
+len (_ : xs) = 1 + len xs
+"""
+
+DEMO_REPORT = """\
+Info:SrcLoc "Demo.hs" 1 1:module Demo has 13 lines of code
+Debug:SrcLoc "Demo.hs" 4 1:type signature for sign has 1 arguments
+Debug:SrcLoc "Demo.hs" 5 1:function sign has 4 lines of code
+Debug:SrcLoc "Demo.hs" 5 1:function sign has cyclomatic complexity of 3
+Info:SrcLoc "Demo.hs" 5 1:function sign has branching depth of 1
+Debug:SrcLoc "Demo.hs" 10 1:type signature for describe has 2 arguments
+Debug:SrcLoc "Demo.hs" 11 1:function describe has 3 lines of code
+Debug:SrcLoc "Demo.hs" 11 1:function describe has cyclomatic complexity of 3
+Info:SrcLoc "Demo.hs" 11 1:function describe has branching depth of 2
+Debug:SrcLoc "Demo.hs" 15 1:type signature for len has 1 arguments
+Debug:SrcLoc "Demo.hs" 16 1:function len has 2 lines of code
+Debug:SrcLoc "Demo.hs" 16 1:function len has cyclomatic complexity of 2
+Info:SrcLoc "Demo.hs" 16 1:function len has branching depth of 0
+"""
+
+def metrics_by_name(code):
+    return {f["name"]: f for f in function_metrics(code)}
+
+def test_function_metrics():
+    metrics = metrics_by_name(DEMO)
+    assert {name: (f["cyclomatic_complexity"], f["branching_depth"], f["lines_of_code"], f["arguments"])
+            for name, f in metrics.items()} == {
+        "sign": (3, 1, 4, 1),
+        "describe": (3, 2, 3, 2),
+        "len": (2, 0, 2, 1),
+    }
+    assert (metrics["len"]["line"], metrics["len"]["signature_line"], metrics["len"]["clauses"]) == (16, 15, 2)
+
+def test_report_matches_homplexity_format():
+    assert homplexity_report(DEMO, "Demo.hs") == DEMO_REPORT
+    data = parse_homplexity_output(DEMO_REPORT)
+    assert data["cyclomatic_complexity"] == {"min": 2, "max": 3, "average": 8 / 3, "sum": 8}
+    assert data["branching_depth"] == 2
+    assert [(d["name"], d["line"], d["signature_arguments"]) for d in data["declarations"]] == [
+        ("sign", 5, 1), ("describe", 11, 2), ("len", 16, 1)
+    ]
+
+def test_nested_branches():
+    code = """\
+classify :: Int -> Int -> String
+classify x y
+  | x > 0 = case y of
+      0 -> "a"
+      1 -> if x > 1 then "b" else "c"
+      _ -> "d"
+  | otherwise = "e"
+"""
+    f = metrics_by_name(code)["classify"]
+    # guards: +1, case alternatives: +2, if: +1
+    assert (f["cyclomatic_complexity"], f["branching_depth"], f["lines_of_code"]) == (5, 3, 6)
+
+def test_signature_arguments():
+    assert signature_arguments("f :: (Ord a, Show a) => (a -> a) -> [a] -> Maybe a") == 2
+    assert signature_arguments("f :: Int") == 0
+    assert signature_arguments("f x = x") is None
+
+def test_comments_and_strings_are_blanked_in_place():
+    code = 'f = "-- not a comment" {- note\x0cpage -} -- tail\ng = 1\n'
+    blanked = blank_comments_and_strings(code)
+    assert len(blanked) == len(code)
+    assert blanked.splitlines() == ["f = " + " " * 18 + " " * 8, " " * 15, "g = 1"]
+
+def test_line_breaks_inside_comments_keep_lines_aligned():
+    code = "module A where\n\n{- a comment\x0cwith a form feed\x0b -}\nf :: Int -> Int\nf x = x + 1\n"
+    f = metrics_by_name(code)["f"]
+    assert (f["cyclomatic_complexity"], f["lines_of_code"], f["arguments"]) == (1, 1, 1)
+
+def test_signature_after_first_clause():
+    code = "module A where\n\nf x = x + 1\nf :: Int -> Int\n"
+    f = metrics_by_name(code)["f"]
+    assert (f["line"], f["signature_line"], f["arguments"], f["lines_of_code"]) == (3, 4, 1, 1)
+    [record] = parse_homplexity_output(homplexity_report(code, "A.hs"))["declarations"]
+    assert (record["name"], record["line"], record["signature_arguments"]) == ("f", 3, 1)
+
+def test_signature_for_several_names():
+    code = "module A where\n\ng, h :: Int -> Int\ng = id\nh x = x\n"
+    metrics = metrics_by_name(code)
+    assert [(name, f["signature_line"], f["arguments"], f["lines_of_code"]) for name, f in metrics.items()] == [
+        ("g", 3, 1, 1), ("h", 3, 1, 1)
+    ]
+
+def test_estimator_failure_gives_empty_metrics(tmp_path, monkeypatch):
+    def broken(code, file_path):
+        raise IndexError("list index out of range")
+    monkeypatch.setattr(homplexity_analysis, "homplexity_report", broken)
+    path = tmp_path / "A.hs"
+    path.write_text("module A where\n")
+    data = native_homplexity_analysis(str(path))
+    assert data["cyclomatic_complexity"] == {"min": 0, "max": 0, "average": 0, "sum": 0}
+    assert data["declarations"] == []
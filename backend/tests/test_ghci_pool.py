@@ -0,0 +1,133 @@
+import os
+import stat
+import sys
+import textwrap
+
+import pytest
+
+import ghci_pool
+from ghci_pool import GhciError, GhciPool, GhciSession
+
+# Stands in for ghci: answers every command followed by the current prompt and
+# logs the commands it gets to $FAKE_GHCI_LOG, one per line.
+FAKE_GHCI = textwrap.dedent("""\
+    #!{python}
+    import ast, os, sys, time
+
+    log = open(os.environ["FAKE_GHCI_LOG"], "a")
+    prompt = "ghci> "
+    sys.stdout.write("GHCi, version 9.6.6: https://www.haskell.org/ghc/  :? for help\\n" + prompt)
+    sys.stdout.flush()
+    for line in sys.stdin:
+        command = line.rstrip("\\n")
+        log.write(command + "\\n")
+        log.flush()
+        if command.startswith(":set prompt "):
+            prompt = ast.literal_eval(command[len(":set prompt "):])
+        elif command.startswith(":load "):
+            sys.stdout.write("[1 of 1] Compiling A\\nA.hs:3:1: error: oops\\nFailed, no modules loaded.\\n")
+        elif command == ":reload":
+            sys.stdout.write("Ok, one module reloaded.\\n")
+        elif command == ":partial":
+            sys.stdout.write("no newline")
+        elif command == ":hang":
+            time.sleep(30)
+        elif command == ":crash":
+            sys.exit(3)
+        elif command == ":quit":
+            sys.exit(0)
+        sys.stdout.write(prompt)
+        sys.stdout.flush()
+""")
+
+@pytest.fixture
+def fake_ghci(tmp_path, monkeypatch):
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    script = bin_dir / "ghci"
+    script.write_text(FAKE_GHCI.format(python=sys.executable))
+    script.chmod(script.stat().st_mode | stat.S_IXUSR)
+    log = tmp_path / "ghci.log"
+    log.touch()
+    monkeypatch.setenv("PATH", f"{bin_dir}{os.pathsep}{os.environ['PATH']}")
+    monkeypatch.setenv("FAKE_GHCI_LOG", str(log))
+    monkeypatch.setattr(ghci_pool, "GHCI_TIMEOUT", 5)
+    return lambda: log.read_text().splitlines()
+
+def test_command_output_ends_at_sentinel_prompt(fake_ghci):
+    session = GhciSession()
+    try:
+        assert session.command(":partial") == "no newline"
+        assert session.command(":show") == ""
+        assert session.alive()
+    finally:
+        session.close()
+    assert not session.alive()
+    assert fake_ghci()[-1] == ":quit"
+
+def test_check_loads_then_reloads(fake_ghci):
+    session = GhciSession()
+    try:
+        output = session.check(["/src/my project/A.hs"], ["/src/my project", "/src/lib"])
+        assert output.splitlines() == ["[1 of 1] Compiling A", "A.hs:3:1: error: oops", "Failed, no modules loaded."]
+        assert session.check(["/src/my project/A.hs"], ["/src/my project", "/src/lib"]) == "Ok, one module reloaded."
+        assert session.loads == 2
+    finally:
+        session.close()
+    assert fake_ghci()[1:5] == [
+        ":set -i",
+        ':set "-i/src/my project" "-i/src/lib"',
+        ':load "/src/my project/A.hs"',
+        ":reload",
+    ]
+
+def test_timeout_raises(fake_ghci, monkeypatch):
+    session = GhciSession()
+    monkeypatch.setattr(ghci_pool, "GHCI_TIMEOUT", 0.2)
+    try:
+        with pytest.raises(GhciError, match="did not answer"):
+            session.command(":hang")
+    finally:
+        session.close()
+    assert not session.alive()
+
+def test_exited_session_raises(fake_ghci):
+    session = GhciSession()
+    with pytest.raises(GhciError, match="exited with status 3"):
+        session.command(":crash")
+    assert not session.alive()
+    with pytest.raises(GhciError):
+        session.command(":show")
+
+def test_pool_reuses_and_recycles_sessions(fake_ghci, monkeypatch):
+    monkeypatch.setattr(ghci_pool, "GHCI_MAX_LOADS", 2)
+    pool = GhciPool(1)
+    try:
+        with pool.session() as first:
+            first.check(["A.hs"])
+        with pool.session() as session:
+            assert session is first
+            session.check(["A.hs"])
+        # Worn out after GHCI_MAX_LOADS loads
+        with pool.session() as session:
+            assert session is not first
+            second = session
+        assert not first.alive()
+
+        # A session that raised is closed rather than put back
+        with pytest.raises(GhciError):
+            with pool.session() as session:
+                assert session is second
+                session.command(":crash")
+        with pool.session() as session:
+            assert session is not second
+            third = session
+
+        # An idle session that has exited is replaced
+        third.process.kill()
+        third.process.wait()
+        with pool.session() as session:
+            assert session is not third
+            assert session.alive()
+    finally:
+        pool.close()
@@ -0,0 +1,128 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+import llm_client
+from llm_client import LLMClient
+
+MESSAGES = [{"role": "user", "content": "hi"}]
+
+class StubServer:
+    """
+    Local chat-completions endpoint. Answers with the scripted (status, headers) pairs
+    in order, then 200 with a canned completion, each after `delay` seconds; records
+    the arrival time of every request and the most requests it had in flight at once.
+    """
+    def __init__(self, script=(), delay=0):
+        self.script = list(script)
+        self.delay = delay
+        self.arrivals = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.lock = threading.Lock()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                self.rfile.read(int(self.headers["Content-Length"]))
+                with stub.lock:
+                    stub.arrivals.append(time.monotonic())
+                    stub.in_flight += 1
+                    stub.max_in_flight = max(stub.max_in_flight, stub.in_flight)
+                    status, headers = stub.script.pop(0) if stub.script else (200, {})
+                time.sleep(stub.delay)
+                body = json.dumps({"choices": [{"message": {"content": "ok"}}]}).encode()
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+                with stub.lock:
+                    stub.in_flight -= 1
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_port}/chat/completions"
+        threading.Thread(target=self.server.serve_forever, args=(0.05,), daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+@pytest.fixture
+def stub_server():
+    servers = []
+    def start(*args, **kwargs):
+        servers.append(StubServer(*args, **kwargs))
+        return servers[-1]
+    yield start
+    for server in servers:
+        server.close()
+
+@pytest.fixture(autouse=True)
+def fast_backoff(monkeypatch):
+    monkeypatch.setattr(llm_client, "LLM_BACKOFF_BASE", 0.01)
+
+def make_client(url, concurrency=8, rate=1000, burst=1000, max_retries=4):
+    return LLMClient(url, concurrency, rate, burst, max_retries, timeout=10)
+
+def run_parallel(client, n):
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(client.chat("m", MESSAGES, "key")))
+        for _ in range(n)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+def test_concurrency_cap(stub_server):
+    server = stub_server(delay=0.2)
+    results = run_parallel(make_client(server.url, concurrency=2), 6)
+    assert len(results) == 6
+    assert server.max_in_flight == 2
+
+def test_token_bucket_paces_request_starts(stub_server):
+    server = stub_server()
+    run_parallel(make_client(server.url, rate=10, burst=2), 6)
+    arrivals = sorted(server.arrivals)
+    # The burst goes out at once, the other four follow at 10 per second
+    assert arrivals[1] - arrivals[0] < 0.05
+    assert arrivals[-1] - arrivals[0] >= 0.35
+
+def test_retries_429_and_5xx(stub_server):
+    server = stub_server(script=[(500, {}), (503, {}), (429, {})])
+    response = make_client(server.url).chat("m", MESSAGES, "key")
+    assert response["choices"][0]["message"]["content"] == "ok"
+    assert len(server.arrivals) == 4
+
+def test_gives_up_after_max_retries(stub_server):
+    server = stub_server(script=[(502, {})] * 3)
+    with pytest.raises(requests.HTTPError):
+        make_client(server.url, max_retries=2).chat("m", MESSAGES, "key")
+    assert len(server.arrivals) == 3
+
+def test_client_errors_are_not_retried(stub_server):
+    server = stub_server(script=[(400, {})])
+    with pytest.raises(requests.HTTPError):
+        make_client(server.url).chat("m", MESSAGES, "key")
+    assert len(server.arrivals) == 1
+
+def test_retry_after_is_honoured(stub_server):
+    server = stub_server(script=[(429, {"Retry-After": "1"})])
+    client = make_client(server.url)
+    client.chat("m", MESSAGES, "key")
+    assert len(server.arrivals) == 2
+    assert 1 <= server.arrivals[1] - server.arrivals[0] < 1.5
+    # The pause holds back every caller of the client, not just the one that was limited
+    assert client.bucket.not_before >= server.arrivals[0] + 1
@@ -0,0 +1,84 @@
+import os
+import shutil
+import subprocess
+
+import pytest
+
+import project_ingestion
+from project_ingestion import ingest_project
+
+def git(*args, cwd):
+    return subprocess.run(
+        ["git", "-c", "user.name=Test", "-c", "user.email=test@example.com"] + list(args),
+        cwd=cwd, check=True, capture_output=True, text=True
+    ).stdout.strip()
+
+def commit_file(repo, path, content):
+    os.makedirs(os.path.dirname(os.path.join(repo, path)) or repo, exist_ok=True)
+    with open(os.path.join(repo, path), "w") as f:
+        f.write(content)
+    git("add", path, cwd=repo)
+    git("commit", "--quiet", "-m", f"Add {path}", cwd=repo)
+    return git("rev-parse", "HEAD", cwd=repo)
+
+@pytest.fixture
+def upstream(tmp_path, monkeypatch):
+    if shutil.which("git") is None:
+        pytest.skip("git is not installed")
+    monkeypatch.setattr(project_ingestion, "GIT_MIRROR_DIR", str(tmp_path / "mirrors"))
+    repo = tmp_path / "upstream"
+    repo.mkdir()
+    git("init", "--quiet", "-b", "main", cwd=repo)
+    commit_file(str(repo), "README.md", "# Demo\n")
+    commit_file(str(repo), "src/A.hs", "module A where\n")
+    return str(repo)
+
+def test_repo_ingested_twice_reuses_and_fetches_mirror(upstream):
+    repo_url = "file://" + upstream
+    project_dirs = []
+    try:
+        source_files, project_dir = ingest_project(repo_url=repo_url, branch="main")
+        project_dirs.append(project_dir)
+        assert [os.path.relpath(f, project_dir) for f in source_files] == ["src/A.hs"]
+        # Sparse checkout only writes project files
+        assert not os.path.exists(os.path.join(project_dir, "README.md"))
+
+        mirrors = os.listdir(project_ingestion.GIT_MIRROR_DIR)
+        assert len(mirrors) == 1
+        mirror_dir = os.path.join(project_ingestion.GIT_MIRROR_DIR, mirrors[0])
+        # Survives only if the mirror is fetched into rather than cloned again
+        marker = os.path.join(mirror_dir, "reused")
+        open(marker, "w").close()
+        first_pack = set(os.listdir(os.path.join(mirror_dir, "objects", "pack")))
+
+        head = commit_file(upstream, "src/B.hs", "module B where\nimport A\n")
+        source_files, project_dir = ingest_project(repo_url=repo_url, branch="main")
+        project_dirs.append(project_dir)
+        assert sorted(os.path.relpath(f, project_dir) for f in source_files) == ["src/A.hs", "src/B.hs"]
+
+        assert os.listdir(project_ingestion.GIT_MIRROR_DIR) == mirrors
+        assert os.path.exists(marker)
+        assert git("rev-parse", "refs/heads/main", cwd=mirror_dir) == head
+        # The objects of the first clone stay where they were; the fetch only adds the new ones
+        assert first_pack <= set(os.listdir(os.path.join(mirror_dir, "objects", "pack")))
+        assert git("cat-file", "-t", head, cwd=mirror_dir) == "commit"
+    finally:
+        # project_dir is the pre_refactor tree; its parent holds the variant trees too
+        for project_dir in project_dirs:
+            shutil.rmtree(os.path.dirname(project_dir), ignore_errors=True)
+
+def test_unreachable_remote_keeps_serving_mirror(upstream, tmp_path):
+    repo_url = "file://" + upstream
+    mirror_dir = project_ingestion.update_mirror(repo_url)
+    assert mirror_dir is not None
+    shutil.rmtree(upstream)
+    assert project_ingestion.update_mirror(repo_url) == mirror_dir
+
+    target_dir = str(tmp_path / "checkout")
+    assert project_ingestion.checkout_worktree(mirror_dir, "main", target_dir)
+    assert os.path.exists(os.path.join(target_dir, "src", "A.hs"))
+    assert not project_ingestion.checkout_worktree(mirror_dir, "no-such-branch", str(tmp_path / "missing"))
+
+def test_clone_failure_returns_none(tmp_path, monkeypatch):
+    monkeypatch.setattr(project_ingestion, "GIT_MIRROR_DIR", str(tmp_path / "mirrors"))
+    assert project_ingestion.update_mirror("file://" + str(tmp_path / "nowhere")) is None
@@ -0,0 +1,48 @@
+import sqlite3
+
+import pytest
+
+import tool_cache
+from tool_cache import ResultCache
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(tool_cache, "ACCESS_TOUCH_INTERVAL", 0)
+    return ResultCache(str(tmp_path / "cache.sqlite"), max_bytes=10 ** 6)
+
+def last_access(cache, key):
+    return sqlite3.connect(cache.path).execute("SELECT last_access FROM entries WHERE key = ?", (key,)).fetchone()[0]
+
+def test_hits_do_not_write_until_flushed(cache):
+    cache.put("a", {"errors": 1})
+    stored = last_access(cache, "a")
+    assert cache.get("a") == {"errors": 1}
+    assert last_access(cache, "a") == stored
+    cache.flush()
+    assert last_access(cache, "a") > stored
+
+def test_pending_access_times_are_written_in_batches(cache, monkeypatch):
+    monkeypatch.setattr(tool_cache, "ACCESS_FLUSH_SIZE", 2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    stored = last_access(cache, "a"), last_access(cache, "b")
+    cache.get("a")
+    assert set(cache.touched) == {"a"}
+    cache.get("b")
+    assert cache.touched == {}
+    assert last_access(cache, "a") > stored[0] and last_access(cache, "b") > stored[1]
+
+def test_recent_entries_are_not_touched(cache, monkeypatch):
+    monkeypatch.setattr(tool_cache, "ACCESS_TOUCH_INTERVAL", 3600)
+    cache.put("a", 1)
+    cache.get("a")
+    assert cache.touched == {}
+
+def test_eviction_sees_pending_hits(cache):
+    cache.put("a", "x" * 100)
+    cache.put("b", "x" * 100)
+    cache.get("a")
+    cache.max_bytes = 250
+    cache.put("c", "x" * 100)
+    assert cache.get("a") == "x" * 100
+    assert cache.get("b") is None
@@ -0,0 +1,134 @@
+# tool_cache.py
+import atexit
+import hashlib
+import json
+import os
+import sqlite3
+import subprocess
+import threading
+import time
+from functools import lru_cache
+
+TOOL_CACHE_PATH = os.getenv("TOOL_CACHE_PATH", "/tmp/tool_cache.sqlite")
+TOOL_CACHE_MAX_BYTES = int(os.getenv("TOOL_CACHE_MAX_BYTES", 512 * 1024 * 1024))
+TOOL_CACHE_ENABLED = os.getenv("TOOL_CACHE_ENABLED", "1") != "0"
+# A hit refreshes an entry's last access only if it is older than this many seconds;
+# refreshed times are written in batches of ACCESS_FLUSH_SIZE (and before any eviction).
+ACCESS_TOUCH_INTERVAL = float(os.getenv("CACHE_ACCESS_TOUCH_INTERVAL", 60))
+ACCESS_FLUSH_SIZE = int(os.getenv("CACHE_ACCESS_FLUSH_SIZE", 256))
+
+class ResultCache:
+    """
+    On-disk JSON result store backed by SQLite. Entries are evicted least
+    recently used first once the stored values exceed max_bytes, and are treated
+    as missing once they are older than ttl seconds (if given). Hits do not write:
+    last-access times are kept in memory and stored in batches, so recency is only
+    tracked to within ACCESS_TOUCH_INTERVAL.
+    """
+    def __init__(self, path, max_bytes, enabled=True, ttl=None):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.enabled = enabled
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        # key -> last access not yet written
+        self.touched = {}
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, value TEXT, size INTEGER, last_access REAL, created REAL)"
+        )
+        columns = [row[1] for row in self.conn.execute("PRAGMA table_info(entries)")]
+        if "created" not in columns:
+            self.conn.execute("ALTER TABLE entries ADD COLUMN created REAL")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS entries_last_access ON entries (last_access)")
+        self.conn.commit()
+        self.total_bytes = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+
+    def get(self, key):
+        if not self.enabled:
+            return None
+        with self.lock:
+            row = self.conn.execute("SELECT value, size, created, last_access FROM entries WHERE key = ?", (key,)).fetchone()
+            now = time.time()
+            if row is not None and self.ttl is not None and (row[2] or 0) + self.ttl < now:
+                self.conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+                self.conn.commit()
+                self.total_bytes -= row[1]
+                self.touched.pop(key, None)
+                row = None
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            if key not in self.touched and (row[3] or 0) + ACCESS_TOUCH_INTERVAL < now:
+                self.touched[key] = now
+                if len(self.touched) >= ACCESS_FLUSH_SIZE:
+                    self._write_access()
+                    self.conn.commit()
+        return json.loads(row[0])
+
+    def _write_access(self):
+        self.conn.executemany(
+            "UPDATE entries SET last_access = ? WHERE key = ?", [(now, key) for key, now in self.touched.items()]
+        )
+        self.touched.clear()
+
+    def flush(self):
+        """Writes the pending last-access times."""
+        with self.lock:
+            if self.touched:
+                self._write_access()
+                self.conn.commit()
+
+    def put(self, key, value):
+        if not self.enabled:
+            return
+        data = json.dumps(value)
+        with self.lock:
+            # Evict by up-to-date recency
+            if self.touched:
+                self._write_access()
+            old = self.conn.execute("SELECT size FROM entries WHERE key = ?", (key,)).fetchone()
+            if old:
+                self.total_bytes -= old[0]
+            now = time.time()
+            self.conn.execute(
+                "INSERT OR REPLACE INTO entries (key, value, size, last_access, created) VALUES (?, ?, ?, ?, ?)",
+                (key, data, len(data), now, now)
+            )
+            self.total_bytes += len(data)
+            while self.total_bytes > self.max_bytes:
+                oldest = self.conn.execute("SELECT key, size FROM entries ORDER BY last_access LIMIT 1").fetchone()
+                if oldest is None:
+                    break
+                self.conn.execute("DELETE FROM entries WHERE key = ?", (oldest[0],))
+                self.total_bytes -= oldest[1]
+            self.conn.commit()
+
+    def stats(self):
+        with self.lock:
+            entries = self.conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+        return {"hits": self.hits, "misses": self.misses, "entries": entries, "bytes": self.total_bytes}
+
+@lru_cache(maxsize=None)
+def tool_version(tool):
+    try:
+        result = subprocess.run([tool, "--version"], capture_output=True, text=True)
+    except OSError:
+        return "unknown"
+    lines = result.stdout.strip().splitlines()
+    return lines[0] if result.returncode == 0 and lines else "unknown"
+
+def file_digest(file_path):
+    with open(file_path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+def cache_key(tool, flags, digests):
+    """Key for a tool result: tool name, tool version, flags and the SHA-256 of every input it read."""
+    parts = [tool, tool_version(tool), " ".join(flags)] + list(digests)
+    return hashlib.sha256("\0".join(parts).encode()).hexdigest()
+
+tool_cache = ResultCache(TOOL_CACHE_PATH, TOOL_CACHE_MAX_BYTES, TOOL_CACHE_ENABLED)
+atexit.register(tool_cache.flush)
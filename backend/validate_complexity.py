@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+import argparse
+import os
+import re
+import subprocess
+import time
+
+from complexity import function_metrics, unliterate
+from project_ingestion import get_haskell_files
+
+HOMPLEXITY_CC = re.compile(r"function (\S+) has cyclomatic complexity of (\d+)")
+
+def homplexity_cc(file_path):
+    """Per-function cyclomatic complexity reported by homplexity-cli, or None if it fails on the file."""
+    try:
+        result = subprocess.run(["homplexity-cli", "--severity", "Debug", file_path], capture_output=True, text=True, check=True)
+    except (subprocess.CalledProcessError, OSError):
+        return None
+    return {name: int(cc) for name, cc in HOMPLEXITY_CC.findall(result.stdout)}
+
+def read_code(file_path):
+    with open(file_path, "r") as f:
+        code = f.read()
+    return unliterate(code) if file_path.endswith(".lhs") else code
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compare the native complexity estimator with homplexity-cli on a corpus and measure its throughput."
+    )
+    parser.add_argument("paths", nargs="+", help="Haskell files or directories to scan")
+    parser.add_argument("--repeat", type=int, default=5, help="Passes over the corpus when timing the estimator")
+    parser.add_argument("--show", type=int, default=10, help="Number of largest disagreements to list")
+    args = parser.parse_args()
+
+    source_files = []
+    for path in args.paths:
+        source_files += get_haskell_files(path)[0] if os.path.isdir(path) else [path]
+    codes = {file_path: read_code(file_path) for file_path in source_files}
+
+    start = time.perf_counter()
+    for _ in range(args.repeat):
+        native = {file_path: function_metrics(code) for file_path, code in codes.items()}
+    elapsed = time.perf_counter() - start
+    print(f"Native estimator: {len(codes) * args.repeat / elapsed:.0f} files/s over {len(codes)} files")
+
+    compared = exact = skipped = 0
+    abs_error = 0
+    file_sums = []
+    disagreements = []
+    for file_path in source_files:
+        reference = homplexity_cc(file_path)
+        if reference is None:
+            skipped += 1
+            continue
+        estimate = {f["name"]: f["cyclomatic_complexity"] for f in native[file_path]}
+        for name, cc in reference.items():
+            if name not in estimate:
+                disagreements.append((cc, file_path, name, cc, None))
+                continue
+            compared += 1
+            exact += estimate[name] == cc
+            abs_error += abs(estimate[name] - cc)
+            if estimate[name] != cc:
+                disagreements.append((abs(estimate[name] - cc), file_path, name, cc, estimate[name]))
+        file_sums.append((sum(reference.values()), sum(estimate.values())))
+
+    if not compared:
+        print("homplexity-cli produced no comparable results" + (f" ({skipped} files failed)" if skipped else ""))
+        return
+    matching_sums = sum(1 for reference, estimate in file_sums if reference == estimate)
+    print(f"Functions compared: {compared}  exact: {exact / compared:.1%}  mean absolute error: {abs_error / compared:.2f}")
+    print(f"Files with matching CC sum: {matching_sums}/{len(file_sums)}  homplexity-cli failed on {skipped} files")
+    print(f"{'File':<40} {'Function':<24} {'homplexity':>10} {'native':>7}")
+    for _, file_path, name, reference, estimate in sorted(disagreements, reverse=True, key=lambda d: d[0])[:args.show]:
+        print(f"{os.path.basename(file_path):<40} {name:<24} {reference:>10} {'-' if estimate is None else estimate:>7}")
+
+if __name__ == "__main__":
+    main()
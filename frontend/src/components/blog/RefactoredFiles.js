@@ -32,21 +32,26 @@ class RefactoredFiles extends React.Component {
     };
   }
 
-  componentDidMount() {
-    fetch("http://localhost:8000/result_json")
+  // Pages through /files collecting only the file ids of one report variant
+  fetchFileIds(variant, cursor = 0, ids = []) {
+    return fetch(`http://localhost:8000/files?variant=${variant}&fields=file_id&limit=500&cursor=${cursor}`)
       .then((res) => res.json())
-      .then((data) => {
-        const preFiles = data.analysis.pre_refactor.files || [];
-        const postFiles = data.analysis.post_refactor.hybrid.one_shot.files || [];
+      .then((page) => {
+        const allIds = ids.concat(page.files.map(f => f.file_id));
+        return page.next_cursor === null ? allIds : this.fetchFileIds(variant, page.next_cursor, allIds);
+      });
+  }
 
-        const preFileNames = preFiles.map(f => f.file_name.split("/pre_refactor/").pop());
-        const postFileNames = postFiles.map(f => f.file_name.split("/pre_refactor/").pop());
+  componentDidMount() {
+    Promise.all([this.fetchFileIds("pre_refactor"), this.fetchFileIds("hybrid")])
+      .then(([preFileIds, postFileIds]) => {
+        const postFileIdSet = new Set(postFileIds);
 
         let refactoredCount = 0;
         let nonRefactoredCount = 0;
 
-        preFileNames.forEach(file => {
-          if (postFileNames.includes(file)) {
+        preFileIds.forEach(id => {
+          if (postFileIdSet.has(id)) {
             refactoredCount++;
           } else {
             nonRefactoredCount++;